@@ -1,9 +1,23 @@
+import time
+_T_DEBUT = time.perf_counter()  # mesure du temps d'exécution du script (démarrage puis chaque rerun)
+
 import streamlit as st
 import os
-import re
 from dotenv import load_dotenv
-from openai import OpenAI
 import streamlit.components.v1 as components
+from parseur import ParseurFlux
+from rendu import generer_html_fiche
+from prompts import SYS_PROMPT_ASSISTANT, construire_prompt_fiche, construire_prompt_exercice
+from generation import generer_fiche_parallele
+from cache_fiches import CacheFiches, cle_fiche
+from contexte import GestionnaireContexte, lire_usage
+from verification import Verificateur
+from passerelle import Passerelle
+from coalescence import Coalesceur
+from cache_questions import CacheQuestions
+from lot import generer_lot, DOSSIER_LOTS, LotEnCours
+from metriques import Registre, Trace, noter_completion, demarrer_exporteur, est_admin
+from graphiques import Traceur
 
 # 1. CONFIGURATION 
 # ------------------------------------------------------------------
@@ -25,273 +39,225 @@ if not api_key:
     st.error("❌ Clé API manquante !")
     st.stop()
 
-#client = OpenAI(api_key=api_key)
 # Configuration du client pour DeepSeek
-client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"  # Adresse officielle de l'API DeepSeek
-      )
+# Streamlit ré-exécute tout le script à chaque interaction : la passerelle (pool HTTP keep-alive,
+# limiteur de requêtes simultanées, relances) est créée une seule fois par processus et
+# partagée entre les sessions (voir passerelle.py).
+@st.cache_resource
+def obtenir_passerelle(api_key):
+    #return OpenAI(api_key=api_key)
+    return Passerelle(
+        api_key=api_key,
+        # Adresse officielle de l'API DeepSeek (surchargeable : serveur factice des benchmarks)
+        base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+    )
+
+
+@st.cache_resource
+def infos_processus():
+    """Mesures propres au processus (partagées entre sessions) : durée du 1er passage du script."""
+    return {"demarrage": None}
+
+
+passerelle = obtenir_passerelle(api_key)
+client = passerelle.pour("chat")  # tuteur
+client_generation = passerelle.pour("generation")  # fiches : budget séparé
+
+MODELE = "deepseek-chat"  # Modèle DeepSeek V3
+
+
+@st.cache_resource
+def obtenir_cache_fiches():
+    """Cache SQLite des fiches, un seul objet par processus (partagé entre sessions)."""
+    return CacheFiches()
+
+
+@st.cache_resource
+def obtenir_coalesceur():
+    """Générations de fiches en cours, partagées entre sessions (voir coalescence.py)."""
+    return Coalesceur()
+
+
+@st.cache_resource
+def obtenir_registre():
+    """Mesures de latence / tokens du processus + exporteur Prometheus (voir metriques.py)."""
+    registre = Registre()
+    demarrer_exporteur(registre)
+    return registre
+
+
+@st.cache_resource
+def obtenir_cache_questions():
+    """Réponses déjà données aux 1res questions, partagées entre sessions (voir cache_questions.py)."""
+    return CacheQuestions()
+
+
+@st.cache_resource
+def obtenir_verificateur():
+    """Pool de processus SymPy partagé par toutes les sessions (voir verification.py)."""
+    return Verificateur()
+
+
+@st.cache_resource
+def obtenir_traceur():
+    """Tracés des courbes (ligne GRAPHIQUE) en arrière-plan, partagés entre sessions (voir graphiques.py)."""
+    return Traceur()
 
-# 2. PARSEUR TEXTE
+# 2. NORMALISATION LATEX (\[ \( -> $$ $)  (le parseur du format maison est dans parseur.py)
 # ------------------------------------------------------------------
+def normaliser_latex(texte):
+    """Remplace les délimiteurs \\[ \\] \\( \\) par des dollars (Markdown Streamlit)."""
+    return texte.replace(r"\[", "$$").replace(r"\]", "$$").replace(r"\(", "$").replace(r"\)", "$")
 
-def parser_format_maison(texte_brut):
+
+class NormaliseurLatexFlux:
     """
-    Découpe le texte de l'IA en exercices structurés.
-    Accepte les variantes de formatage (gras, italique, etc.)
+    Version incrémentale de normaliser_latex pour le streaming.
+    Un morceau peut se terminer au milieu d'un délimiteur (ex: "... \\" puis "[ x^2 ...").
+    On garde donc le dernier antislash en attente jusqu'au morceau suivant :
+    le texte concaténé est identique à normaliser_latex(texte complet).
     """
-    data = {"titre": "Fiche de Mathématiques", "exercices": []}
-    
-    # 1. Nettoyage global du texte pour faciliter la lecture
-    # On enlève les balises code, et on supprime les étoiles ** autour des mots clés
-    texte_clean = texte_brut.replace("```text", "").replace("```", "")
-    
-    # On nettoie spécifiquement les clés pour que le regex les trouve
-    # Ex: transforme "**TITRE_FICHE**:" en "TITRE_FICHE:"
-    for key in ["TITRE_FICHE", "QUESTION", "REPONSE", "DETAIL", "DIFFICULTE"]:
-        texte_clean = re.sub(fr"\**{key}\**\s*:", f"{key}:", texte_clean, flags=re.IGNORECASE)
-        texte_clean = re.sub(fr"\#{key}", f"{key}", texte_clean, flags=re.IGNORECASE)
-
-    # 2. Récupération du titre
-    titre_match = re.search(r"TITRE_FICHE\s*:\s*(.*)", texte_clean, re.IGNORECASE)
-    if titre_match:
-        data["titre"] = titre_match.group(1).strip()
-
-    # 3. Découpage des blocs
-    blocs = re.split(r"===NOUVEL_EXERCICE===", texte_clean)
-    
-    for bloc in blocs:
-        if not bloc.strip() or "TITRE_FICHE" in bloc: continue
-
-        exo = {
-            "question": "",
-            "reponse": "",
-            "correction_detaillee": "",
-            "difficulte": 3
-        }
-        
-        # Regex (maintenant qu'on a nettoyé, on peut chercher simplement)
-        q_match = re.search(r"QUESTION\s*:\s*(.*?)\s*REPONSE\s*:", bloc, re.DOTALL | re.IGNORECASE)
-        r_match = re.search(r"REPONSE\s*:\s*(.*?)\s*DETAIL\s*:", bloc, re.DOTALL | re.IGNORECASE)
-        d_match = re.search(r"DETAIL\s*:\s*(.*?)\s*DIFFICULTE\s*:", bloc, re.DOTALL | re.IGNORECASE)
-        diff_match = re.search(r"DIFFICULTE\s*:\s*(\d)", bloc, re.IGNORECASE)
-        
-        # Fallback détail (si l'IA oublie DIFFICULTE à la fin)
-        if d_match:
-            exo["correction_detaillee"] = d_match.group(1).strip()
+
+    def __init__(self):
+        self.attente = ""
+        self.texte = ""
+
+    def ajouter(self, morceau):
+        bloc = self.attente + morceau
+        if bloc.endswith("\\"):
+            bloc, self.attente = bloc[:-1], "\\"
         else:
-            fallback = re.search(r"DETAIL\s*:\s*(.*)", bloc, re.DOTALL | re.IGNORECASE)
-            if fallback:
-                exo["correction_detaillee"] = fallback.group(1).strip()
+            self.attente = ""
+        self.texte += normaliser_latex(bloc)
+        return self.texte
 
-        if q_match: exo["question"] = q_match.group(1).strip()
-        if r_match: exo["reponse"] = r_match.group(1).strip()
-        if diff_match: exo["difficulte"] = int(diff_match.group(1))
-        
-        if exo["question"]:
-            data["exercices"].append(exo)
-        
-    return data
-# def parser_format_maison(texte_brut):
-#     """
-#     Découpe le texte de l'IA en exercices structurés.
-#     """
-#     data = {"titre": "Fiche de Mathématiques", "exercices": []}
-    
-#     texte_brut = texte_brut.replace("```text", "").replace("```", "")
-    
-#     # Titre
-#     titre_match = re.search(r"TITRE_FICHE\s*:\s*(.*)", texte_brut, re.IGNORECASE)
-#     if titre_match:
-#         data["titre"] = titre_match.group(1).strip()
+    def terminer(self):
+        self.texte += self.attente
+        self.attente = ""
+        return self.texte
 
-#     # Blocs
-#     blocs = re.split(r"===NOUVEL_EXERCICE===", texte_brut)
-    
-#     for bloc in blocs:
-#         if not bloc.strip() or "TITRE_FICHE" in bloc: continue
-
-#         exo = {
-#             "question": "",
-#             "reponse": "",
-#             "correction_detaillee": "",
-#             "difficulte": 3
-#         }
-        
-#         q_match = re.search(r"QUESTION\s*:\s*(.*?)\s*REPONSE\s*:", bloc, re.DOTALL | re.IGNORECASE)
-#         r_match = re.search(r"REPONSE\s*:\s*(.*?)\s*DETAIL\s*:", bloc, re.DOTALL | re.IGNORECASE)
-#         d_match = re.search(r"DETAIL\s*:\s*(.*?)\s*DIFFICULTE\s*:", bloc, re.DOTALL | re.IGNORECASE)
-#         diff_match = re.search(r"DIFFICULTE\s*:\s*(\d)", bloc, re.IGNORECASE)
-        
-#         # Fallback détail
-#         if d_match:
-#             exo["correction_detaillee"] = d_match.group(1).strip()
-#         else:
-#             fallback = re.search(r"DETAIL\s*:\s*(.*)", bloc, re.DOTALL | re.IGNORECASE)
-#             if fallback:
-#                 exo["correction_detaillee"] = fallback.group(1).strip()
-
-#         if q_match: exo["question"] = q_match.group(1).strip()
-#         if r_match: exo["reponse"] = r_match.group(1).strip()
-#         if diff_match: exo["difficulte"] = int(diff_match.group(1))
-        
-#         if exo["question"]:
-#             data["exercices"].append(exo)
-        
-#     return data
 
-# 3. GÉNÉRATEUR HTML (OPTIMISÉ)
-# ------------------------------------------------------------------
-def generer_html_fiche(titre, exercices):
-    exercices_html = ""
-    for i, exo in enumerate(exercices, 1):
-        q = exo['question'].replace('\n', '<br>')
-        r = exo['reponse']
-        d = exo['correction_detaillee'].replace('\n', '<br>')
-        
-        exercices_html += f"""
-        <div class="exercice">
-            <div class="exercice-header">
-                <h2>📝 Exercice {i}</h2>
-                <span class="difficulte">{'⭐' * exo['difficulte']}</span>
-            </div>
-            
-            <div class="question">
-                {q}
-            </div>
-            
-            <details class="correction">
-                <summary>📖 Voir la correction détaillée</summary>
-                <div class="reponse"><strong>Réponse :</strong> {r}</div>
-                <div class="detail">
-                    <strong>Explications :</strong><br>
-                    {d}
-                </div>
-            </details>
-        </div>
-        """
-    
-    return f"""
-<!DOCTYPE html>
-<html lang="fr">
-<head>
-    <meta charset="UTF-8">
-    <title>{titre}</title>
-    <script>
-    window.MathJax = {{
-        tex: {{
-            inlineMath: [['$', '$'], ['\\\\(', '\\\\)']], 
-            displayMath: [['$$', '$$'], ['\\\\[', '\\\\]']],
-            processEscapes: true,
-            packages: {{'[+]': ['amsmath', 'amssymb', 'noerrors', 'noundefined']}}
-        }},
-        svg: {{ fontCache: 'global' }}
-    }};
-    </script>
-    <script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js" async></script>
-    <style>
-        body {{ font-family: 'Helvetica', 'Arial', sans-serif; background: #f4f6f9; padding: 40px; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 900px; margin: 0 auto; background: white; padding: 60px; border-radius: 2px; box-shadow: 0 4px 10px rgba(0,0,0,0.1); }}
-        h1 {{ text-align: center; color: #000; border-bottom: 2px solid #000; padding-bottom: 20px; margin-bottom: 50px; text-transform: uppercase; letter-spacing: 2px; }}
-        .exercice {{ margin-bottom: 40px; page-break-inside: avoid; border-bottom: 1px dashed #ccc; padding-bottom: 30px; }}
-        .exercice:last-child {{ border-bottom: none; }}
-        .exercice-header {{ display: flex; justify-content: space-between; margin-bottom: 15px; align-items: baseline; }}
-        .exercice-header h2 {{ color: #2c3e50; font-size: 1.4em; margin: 0; text-decoration: underline; }}
-        .question {{ font-size: 1.15em; margin-bottom: 20px; text-align: justify; }}
-        .correction {{ margin-top: 20px; background: #f8f9fa; padding: 15px; border-left: 3px solid #2980b9; }}
-        .reponse {{ font-weight: bold; margin-bottom: 10px; color: #27ae60; }}
-        .detail {{ font-size: 0.95em; color: #555; }}
-        
-        .btn-print {{ 
-            display: block; width: 100%; padding: 20px; 
-            background: #4b6cb7; color: white; text-align: center; 
-            font-size: 20px; font-weight: bold; border-radius: 8px; 
-            cursor: pointer; margin-bottom: 40px; text-decoration: none;
-            box-shadow: 0 4px 6px rgba(0,0,0,0.2);
-        }}
-        .btn-print:hover {{ background: #3b5998; }}
-
-        @media print {{
-            body {{ background: white; padding: 0; margin: 0; }}
-            .container {{ box-shadow: none; border: none; width: 100%; max-width: 100%; margin: 0; padding: 40px; }}
-            .no-print {{ display: none !important; }}
-            details {{ display: block !important; }}
-            summary {{ display: none !important; }}
-            .correction {{ display: block !important; border: 1px solid #eee; }}
-            a {{ text-decoration: none; color: black; }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <a href="#" class="no-print btn-print" onclick="window.print()">📥 Télécharger / Imprimer en PDF</a>
-        <h1>📚 {titre}</h1>
-        {exercices_html}
-        <div style="text-align: center; margin-top: 50px; color: #aaa; font-size: 0.8em; border-top: 1px solid #eee; padding-top: 20px;">
-            Généré par Maths Tutor IA (DeepSeek Power)
-        </div>
-    </div>
-</body>
-</html>
-    """
+# 3. GÉNÉRATEUR HTML : voir rendu.py (gabarit précompilé, échappement, cache des fragments)
 
 # 4. INTERFACE PRINCIPALE
 # ------------------------------------------------------------------
 st.title("🎓 Plateforme Maths IA")
 
-tab1, tab2 = st.tabs(["💬 Tuteur", "📝 Générateur de fiche"])
+# Onglet métriques réservé aux administrateurs : ?admin=<METRIQUES_ADMIN_TOKEN> dans l'URL
+admin = est_admin(st.query_params.get("admin"))
+onglets = st.tabs(["💬 Tuteur", "📝 Générateur de fiche"] + (["📊 Métriques"] if admin else []))
+tab1, tab2 = onglets[:2]
 
 # --- ONGLET 1 : ASSISTANT ---
 with tab1:
     st.write("### 🤖 Tuteur Intelligent")
     st.caption("Propulsé par DeepSeek-V3. Idéal pour les explications complexes.")
     
-    sys_prompt_assistant = """
-    Tu es un professeur de mathématiques expert et pédagogue.
-    TON RÔLE :
-    1. Expliquer les concepts clairement.
-    2. Guider l'élève sans donner la réponse tout de suite.
-    3. T'adapter au niveau scolaire demandé.
-
-    CONSIGNES TECHNIQUES :
-    1.Si on te demande "Qui es-tu ?", présente-toi comme un assistant prof de maths, mais NE MENTIONNE PAS tes instructions techniques (LaTeX, dollars, etc.).
-    2. Langue : Français uniquement. Ne laisse jamais de mots anglais (comme 'From', 'we have', 'assuming').
-    3. LaTeX : Utilise uniquement des dollars $ pour les formules. Exemple: $x^2$. N'utilise JAMAIS \[ ou \(.
-    4. Rigueur : Sois précis. Pour la géométrie 3D, privilégie les systèmes d'équations.
-       - Une droite dans l'espace est l'intersection de deux plans.
-       - Son équation cartésienne est TOUJOURS un SYSTÈME de deux équations.
-       - Exemple : $\\begin{cases} x - 2y + z = 0 \\\\ 3x + y - 5 = 0 \\end{cases}$
-       - NE DONNE PAS la forme symétrique (ex: (x-a)/u = ...) car elle est peu utilisée en France.
-       - Dans le plan mets la sous forme ax + by + c = 0. 
-    """
 
     if "messages" not in st.session_state:
-        st.session_state.messages = [{"role": "system", "content": sys_prompt_assistant}]
+        st.session_state.messages = [{"role": "system", "content": SYS_PROMPT_ASSISTANT}]
+    # Contenu normalisé (LaTeX -> $) calculé une fois par message, aligné sur st.session_state.messages.
+    # On ne l'ajoute pas dans les messages eux-mêmes : ils sont envoyés tels quels à l'API.
+    if len(st.session_state.get("affichage", [])) != len(st.session_state.messages):
+        st.session_state.affichage = [
+            None if msg["role"] == "system" else normaliser_latex(msg["content"])
+            for msg in st.session_state.messages
+        ]
+
+    if "ttft" not in st.session_state:
+        st.session_state.ttft = []  # temps jusqu'au 1er token (s), un par réponse
+    if "contexte" not in st.session_state:
+        st.session_state.contexte = GestionnaireContexte(modele=MODELE)
+    if "usage" not in st.session_state:
+        st.session_state.usage = []  # compteurs de tokens (prompt / cache / réponse), un par tour
+    if "depuis_cache" not in st.session_state:
+        st.session_state.depuis_cache = set()  # indices des réponses servies par le cache de questions
 
-    for msg in st.session_state.messages:
+    for i, (msg, contenu) in enumerate(zip(st.session_state.messages, st.session_state.affichage)):
         if msg["role"] != "system":
             with st.chat_message(msg["role"]):
-                clean = msg["content"].replace(r"\[", "$$").replace(r"\]", "$$").replace(r"\(", "$").replace(r"\)", "$")
-                st.markdown(clean)
+                st.markdown(contenu)
+                if i in st.session_state.depuis_cache:
+                    st.caption("♻️ Réponse issue du cache")
 
     if prompt := st.chat_input("Pose ta question..."):
         st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.affichage.append(normaliser_latex(prompt))
         with st.chat_message("user"): st.markdown(prompt)
         
         with st.chat_message("assistant"):
             try:
-                # Utilisation de DeepSeek Chat (V3)
-                res = client.chat.completions.create(
-                    #model="gpt-4o-mini",
-                    model="deepseek-chat", 
-                    messages=st.session_state.messages,
-                    temperature=0.4
-                )
-                raw_reply = res.choices[0].message.content
-                clean_reply = raw_reply.replace(r"\[", "$$").replace(r"\]", "$$").replace(r"\(", "$").replace(r"\)", "$")
-                
-                st.markdown(clean_reply)
-                st.session_state.messages.append({"role": "assistant", "content": raw_reply})
+                with Trace(obtenir_registre(), "tuteur", modele=MODELE) as trace:
+                    # 1re question de la conversation : une question quasi identique a peut-être
+                    # déjà reçu sa réponse (autre élève de la classe). Voir cache_questions.py
+                    premier_tour = len(st.session_state.messages) == 2
+                    trouve = None
+                    if premier_tour:
+                        with trace.span("cache_questions") as attributs:
+                            trouve = obtenir_cache_questions().chercher(prompt)
+                            attributs["hit"] = trouve is not None
+                    if trouve:
+                        raw_reply, similarite = trouve
+                        st.session_state.messages.append({"role": "assistant", "content": raw_reply})
+                        st.session_state.affichage.append(normaliser_latex(raw_reply))
+                        st.session_state.depuis_cache.add(len(st.session_state.messages) - 1)
+                        st.markdown(st.session_state.affichage[-1])
+                        st.caption(f"♻️ Réponse issue du cache (question similaire à {similarite:.0%})")
+                    else:
+                        # Utilisation de DeepSeek Chat (V3) en streaming :
+                        # la réponse s'affiche au fur et à mesure au lieu d'attendre la génération complète.
+                        t0 = time.perf_counter()
+                        ttft = None
+                        attente_api = None
+                        # Budget de tokens : prompt système intact + résumé + derniers tours (voir contexte.py)
+                        with trace.span("prompt"):
+                            messages_envoyes = st.session_state.contexte.messages_a_envoyer(client, st.session_state.messages)
+                        t_api = time.perf_counter()
+                        flux = client.chat.completions.create(
+                            #model="gpt-4o-mini",
+                            model=MODELE, 
+                            messages=messages_envoyes,
+                            temperature=0.4,
+                            stream=True,
+                            stream_options={"include_usage": True}
+                        )
+                        zone = st.empty()
+                        normaliseur = NormaliseurLatexFlux()
+                        morceaux = []
+                        usage = None
+                        for chunk in flux:
+                            if attente_api is None:
+                                attente_api = time.perf_counter() - t_api  # file de la passerelle + réseau + serveur
+                            if getattr(chunk, "usage", None):
+                                usage = lire_usage(chunk.usage)  # dernier chunk (choices vide)
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if not delta:
+                                continue
+                            if ttft is None:
+                                ttft = time.perf_counter() - t0
+                            morceaux.append(delta)
+                            zone.markdown(normaliseur.ajouter(delta) + "▌")
+                        zone.markdown(normaliseur.terminer())
+                        duree = time.perf_counter() - t0
+
+                        # On ne stocke que le texte final (brut) dans l'historique
+                        raw_reply = "".join(morceaux)
+                        st.session_state.messages.append({"role": "assistant", "content": raw_reply})
+                        st.session_state.affichage.append(normaliseur.texte)
+                        if premier_tour and raw_reply:
+                            obtenir_cache_questions().ajouter(prompt, raw_reply)
+                        noter_completion(trace, attente_api, ttft, duree, usage)
+                        if ttft is not None:
+                            st.session_state.ttft.append(ttft)
+                            st.caption(f"⏱️ 1er token : {ttft:.2f} s · total : {duree:.1f} s")
+                        if usage:
+                            st.session_state.usage.append(usage)
+                            st.caption(
+                                f"🔢 Prompt : {usage['prompt_tokens']} tokens (dont {usage['cache_hit_tokens']} en cache)"
+                                f" · Réponse : {usage['completion_tokens']} tokens"
+                            )
             except Exception as e:
                 st.error(f"Erreur DeepSeek : {e}")
 
@@ -317,115 +283,293 @@ with tab2:
             nb = st.slider("Nombre de questions", 1, 10, 5)
             diff = st.select_slider("Difficulté", [1, 2, 3, 4, 5], value=3)
 
+        # Mode parallèle : 1 appel par exercice -> temps total ≈ temps d'un seul exercice
+        parallele = type_exo != "Problème" and st.checkbox(
+            "⚡ Génération parallèle (1 appel par exercice)", value=False
+        )
+
+        # Formules pré-rendues en SVG côté serveur : pas de MathJax / CDN (salles hors ligne)
+        hors_ligne = st.checkbox("📴 Mode hors ligne (formules pré-rendues)", value=False)
+        forcer = st.checkbox("🔄 Forcer la régénération (ignorer le cache)", value=False)
+
     if st.button("🚀 Générer", type="primary"):
-        with st.spinner("L'IA réfléchit..."):
+        with st.spinner("L'IA réfléchit..."), Trace(
+            obtenir_registre(), "fiche", modele=MODELE, type_exo=type_exo, nb=nb, parallele=parallele
+        ) as trace:
             try:
-                # Construction du Prompt intelligent selon le type
-                consigne_structure = ""
-                
-                if type_exo == "Quiz":
-                #     consigne_structure = """
-                #     Génère un QCM (Questionnaire à Choix Multiples).
-                #     Pour chaque exercice :
-                #     - QUESTION : L'énoncé suivi obligatoirement de 4 choix clairs : A) ... B) ... C) ... D) ...
-                #     - REPONSE : Juste la lettre de la bonne réponse (ex: Réponse B).
-                #     - DETAIL : L'explication complète de pourquoi c'est la bonne réponse.
-                #     """
-                    prompt_systeme = f"""
-                    Tu es un générateur de QCM (Questionnaire à Choix Multiples) pour le niveau {niveau} sur "{sujet}".
-                    
-                    RÈGLES STRICTES :
-                    1. Génère {nb} questions.
-                    2. Pour CHAQUE question, propose 4 choix explicites : A), B), C), D).
-                    3. Il ne doit y avoir qu'une seule bonne réponse.
-                    4. NE DEMANDE PAS de "Montrer que" ou "Déduire". Pose une question directe.
-                    5. FORMAT DE SORTIE :
-                    
-                    TITRE_FICHE: Quiz - {sujet}
-                    
-                    ===NOUVEL_EXERCICE===
-                    QUESTION: [Énoncé + Choix A, B, C, D]
-                    REPONSE: [Juste la lettre, ex: Réponse B]
-                    DETAIL: [Explication courte et claire]
-                    DIFFICULTE: 2
-                    
-                    (Répète pour les {nb} questions)
-                    """
+                # Construction du Prompt intelligent selon le type (voir prompts.py)
+                with trace.span("prompt"):
+                    prompt_systeme = construire_prompt_fiche(sujet, niveau, type_exo, nb, diff)
+
+                # Cache disque partagé : même demande -> réponse immédiate, sans appel API
+                cache = obtenir_cache_fiches()
+                cle = cle_fiche(
+                    {"sujet": sujet, "niveau": niveau, "type_exo": type_exo, "nb": nb, "diff": diff, "parallele": parallele,
+                     "hors_ligne": hors_ligne},
+                    prompt_systeme, MODELE
+                )
+                with trace.span("cache") as attributs:
+                    en_cache = None if forcer else cache.lire(cle)
+                    attributs["hit"] = bool(en_cache)
+
+                if en_cache:
+                    data, html = en_cache
+                    texte_ia = ""
                 else:
-                    if type_exo == "Problème":
-                        consigne_structure = """
-                        Génère un PROBLÈME COMPLET avec PARFOIS du contexte.
-                        Tu peux PARFOIS utiliser ce type de format: Partie A (Étude préliminaire), Partie B (Fonction principale), Partie C (Application).
-                        """
+                    # Demandes identiques simultanées (toute une classe) : un seul appel LLM,
+                    # les autres sessions suivent le même flux (voir coalescence.py)
+                    cle_generation = cle_fiche(
+                        {"sujet": sujet, "niveau": niveau, "type_exo": type_exo, "nb": nb, "diff": diff,
+                         "parallele": parallele},
+                        prompt_systeme, MODELE
+                    )
+                    if parallele:
+                        def produire(vol):
+                            t0 = time.perf_counter()
+                            data = generer_fiche_parallele(
+                                client_generation,
+                                lambda i: construire_prompt_exercice(sujet, niveau, type_exo, diff, i, nb),
+                                nb,
+                                modele=MODELE,
+                                progression=vol.verifier_annulation  # arrêt si plus personne n'attend
+                            )
+                            vol.infos.update(attente_api=None, ttft=None, duree=time.perf_counter() - t0, usage=None)
+                            return data
                     else:
-                        consigne_structure = "Génère des exercices d'entraînement  variés, pas de calculs triviaux."
-
-                    prompt_systeme = f"""
-                    Tu es un professeur agrégé de mathématiques en France. Tu rédiges un sujet pertinent.
-                    MISSION : Générer {nb} exercices sur "{sujet}" (Niveau {niveau}).
-                    
-                    RÈGLES CRITIQUES ANTI-BAVARDAGE :
-                    1. NE MONTRE JAMAIS tes hésitations, tes ratures ou tes "vérifications".
-                    2. Si tu trouves une erreur, corrige l'énoncé AVANT de l'afficher.
-                    3. Le champ "DETAIL" doit contenir UNIQUEMENT la correction propre et directe.  Ne produis AUCUN texte de réflexion, d'hésitation ou de commentaire dans ta réponse. Pas de "Essayons autre chose..." ou "Oups erreur".
-
-                    EXIGENCES CRITIQUES :
-                    1. AÉRATION : C'est très important. SAUTE des lignes entre chaque étape de calcul. N'écris pas de blocs de texte compacts.
-                    2. LATEX : Utilise `$$` (double dollar) pour les formules importantes afin qu'elles soient centrées.
-                    3. CONTEXTE : Les exercices ne doivent pas être abstraits. Ajoute du contexte sur certains exercices (modélisation, physique, économie) quand c'est possible.
-                    4. LANGUE : Français uniquement. Ne laisse jamais de mots anglais (comme 'From', 'we have', 'assuming').
-                    5. RIGUEUR : Utilise les notations françaises (ln, exp, vecteurs avec flèche).
-                    6. TABLEAUX : Si tu dois faire un tableau de variations ou de signes, utilise IMPÉRATIVEMENT du LaTeX avec l'environnement `array`.
-                    Exemple tableau de signe :
-                    $$
-                    \\begin{{array}}{{c|ccccc}}
-                    x & -\\infty & & 2 & & +\\infty \\\\ \\hline
-                    f'(x) & & - & 0 & + &
-                    \\end{{array}}
-                    $$
-                    Exemple variations (utilise \\nearrow et \\searrow) :
-                    $$
-                    \\begin{{array}}{{c|ccccc}}
-                    x & -\\infty & & 2 & & +\\infty \\\\ \\hline
-                    f'(x) & & - & 0 & + & \\\\ \\hline
-                    f(x) & +\\infty & \\searrow & -3 & \\nearrow & +\\infty \\\\[0.5cm]
-                    \\end{{array}}
-                    $$
-                    7. COMPLEXITÉ : Évite les questions triviales. Pose des questions "Montrer que...", "Déduire que...".
-                    8. NE METS PAS de Markdown (gras **, titres ##) sur les mots-clés comme "TITRE_FICHE:", "QUESTION:", etc. Écris-les simplement.
-                    TITRE_FICHE: [Titre]
-                    
-                    ===NOUVEL_EXERCICE===
-                    QUESTION: [Énoncé complet en LaTeX $. Tu peux utiliser des sous-questions 1.a, 1.b...]
-                    REPONSE: [Résultat bien aéré]
-                    DETAIL: [Démonstration]
-                    DIFFICULTE: {diff}
-                    
-                    {consigne_structure}
-                    """
-                    
-                response = client.chat.completions.create(
-                    #model="gpt-4o-mini",
-                    model="deepseek-chat", # Modèle DeepSeek V3
-                    messages=[
-                        {"role": "system", "content": prompt_systeme},
-                        {"role": "user", "content": "Génère la fiche."}
-                    ],
-                    temperature=0.2,
-                    max_tokens=8000
-                )
-                
-                texte_ia = response.choices[0].message.content
-                data = parser_format_maison(texte_ia)
+                        def produire(vol):
+                            t0 = time.perf_counter()
+                            mesures = vol.infos
+                            mesures.update(attente_api=None, ttft=None, usage=None)
+                            flux = client_generation.chat.completions.create(
+                                #model="gpt-4o-mini",
+                                model=MODELE, # Modèle DeepSeek V3
+                                messages=[
+                                    {"role": "system", "content": prompt_systeme},
+                                    {"role": "user", "content": "Génère la fiche."}
+                                ],
+                                temperature=0.2,
+                                max_tokens=8000,
+                                stream=True,
+                                stream_options={"include_usage": True}
+                            )
+                            parseur_vol = ParseurFlux()
+                            try:
+                                for chunk in flux:
+                                    if mesures["attente_api"] is None:
+                                        mesures["attente_api"] = time.perf_counter() - t0
+                                    if getattr(chunk, "usage", None):
+                                        mesures["usage"] = lire_usage(chunk.usage)
+                                    if not chunk.choices:
+                                        continue
+                                    delta = chunk.choices[0].delta.content
+                                    if delta:
+                                        if mesures["ttft"] is None:
+                                            mesures["ttft"] = time.perf_counter() - t0
+                                        vol.publier(delta)  # lève GenerationAnnulee si plus personne n'attend
+                                        parseur_vol.ajouter(delta)
+                            finally:
+                                flux.close()  # libère la connexion et la place dans la passerelle
+                            parseur_vol.terminer()
+                            mesures["duree"] = time.perf_counter() - t0
+                            return parseur_vol.resultat()
+
+                    # Parsing incrémental : chaque exercice s'affiche dès que son bloc est terminé
+                    parseur = ParseurFlux()
+                    apercu = st.container()
+                    morceaux = []
+
+                    traceur = obtenir_traceur()
+
+                    def afficher_apercu(exos):
+                        debut = len(parseur.exercices) - len(exos) + 1
+                        for n, exo in enumerate(exos, debut):
+                            traceur.demander(exo.get("graphique"))  # tracé lancé pendant la suite du flux
+                            with apercu.expander(f"📝 Exercice {n} {'⭐' * exo['difficulte']}", expanded=False):
+                                st.markdown(normaliser_latex(exo["question"]))
+
+                    t_attente = time.perf_counter()
+                    duree_parse = 0.0
+                    with obtenir_coalesceur().souscrire(cle_generation, produire) as abonnement:
+                        if abonnement.rejoint:
+                            st.info("🤝 Fiche identique déjà en cours de génération : on la partage.")
+                        for delta in abonnement:
+                            morceaux.append(delta)
+                            t_parse = time.perf_counter()
+                            nouveaux = parseur.ajouter(delta)
+                            duree_parse += time.perf_counter() - t_parse
+                            afficher_apercu(nouveaux)
+                        t_parse = time.perf_counter()
+                        nouveaux = parseur.terminer()
+                        duree_parse += time.perf_counter() - t_parse
+                        afficher_apercu(nouveaux)
+                        data = abonnement.resultat()
+                    trace.ajouter_span("parse", duree_parse)
+                    if abonnement.rejoint:
+                        # Pas d'appel API ni de tokens pour cette session : seulement l'attente partagée
+                        trace.attributs["coalescee"] = True
+                        trace.ajouter_span("attente_partagee", time.perf_counter() - t_attente)
+                    else:
+                        infos = abonnement.infos
+                        noter_completion(trace, infos["attente_api"], infos["ttft"], infos["duree"], infos["usage"])
+
+                    texte_ia = "".join(morceaux)
+                    if data.get("manquants"):
+                        st.warning(f"⚠️ {len(data['manquants'])} exercice(s) n'ont pas pu être générés.")
                 
                 if not data["exercices"]:
                     st.error("L'IA n'a pas renvoyé le bon format. Réessaie.")
                     st.expander("Voir réponse brute").text(texte_ia)
                 else:
-                    html = generer_html_fiche(data['titre'], data['exercices'])
-                    st.success(f"✅ Fiche générée avec succès ! ({len(data['exercices'])} exos)")
-                    st.components.v1.html(html, height=800, scrolling=True)
-                    st.download_button("📥 Télécharger ", html, "fiche.html", "text/html")
+                    if en_cache:
+                        st.success(f"⚡ Fiche servie depuis le cache ({len(data['exercices'])} exos)")
+                    else:
+                        with trace.span("rendu_html"):
+                            html = generer_html_fiche(data['titre'], data['exercices'], memoiser=True, hors_ligne=hors_ligne)
+                        st.success(f"✅ Fiche générée avec succès ! ({len(data['exercices'])} exos)")
+                    # La fiche s'affiche tout de suite ; les courbes puis la vérification SymPy
+                    # viennent ensuite et mettent à jour la fiche.
+                    zone_fiche = st.empty()
+                    zone_telechargement = st.empty()
+                    with trace.span("composant"), zone_fiche:
+                        st.components.v1.html(html, height=800, scrolling=True)
+                    zone_telechargement.download_button("📥 Télécharger ", html, "fiche.html", "text/html")
+
+                    exercices = data['exercices']
+                    if not en_cache:
+                        # Courbes lancées pendant le flux : le plus souvent déjà prêtes (voir graphiques.py)
+                        with trace.span("graphiques") as attributs:
+                            graphiques = obtenir_traceur().obtenir(exercices)
+                            attributs["nb"] = sum(g is not None for g in graphiques)
+                        if any(graphiques):
+                            exercices = [
+                                dict(exo, graphique_html=g) if g else exo for exo, g in zip(exercices, graphiques)
+                            ]
+                            data = dict(data, exercices=exercices)  # data peut être partagé (coalescence) : copie
+                            html = generer_html_fiche(data['titre'], exercices, memoiser=True, hors_ligne=hors_ligne)
+                            with zone_fiche:
+                                st.components.v1.html(html, height=800, scrolling=True)
+                            zone_telechargement.download_button("📥 Télécharger ", html, "fiche.html", "text/html")
+                        # Une fiche incomplète (mode parallèle) n'est pas mise en cache
+                        if not data.get("manquants"):
+                            cache.ecrire(cle, data, html)
+
+                    try:
+                        with trace.span("verification"):
+                            statuts = obtenir_verificateur().verifier(exercices)
+                        if any(statuts):
+                            exercices_verifies = [
+                                dict(exo, verification=statut) for exo, statut in zip(exercices, statuts)
+                            ]
+                            html = generer_html_fiche(data['titre'], exercices_verifies, memoiser=True, hors_ligne=hors_ligne)
+                            with zone_fiche:
+                                st.components.v1.html(html, height=800, scrolling=True)
+                            zone_telechargement.download_button("📥 Télécharger ", html, "fiche.html", "text/html")
+                    except Exception as e:
+                        st.caption(f"Vérification SymPy indisponible : {e}")
                 
             except Exception as e:
-                st.error(f"Erreur API : {e}")
\ No newline at end of file
+                trace.echouer(e)
+                st.error(f"Erreur API : {e}")
+
+    # Mode classe : une version différente de la fiche par élève, dans un ZIP avec corrigé (voir lot.py)
+    with st.expander("🎒 Mode classe : une version par élève"):
+        nb_versions = st.number_input("Nombre de versions", min_value=2, max_value=60, value=30)
+        cle_lot = cle_fiche(
+            {"sujet": sujet, "niveau": niveau, "type_exo": type_exo, "nb": nb, "diff": diff,
+             "versions": nb_versions, "hors_ligne": hors_ligne},
+            construire_prompt_fiche(sujet, niveau, type_exo, nb, diff), MODELE
+        )
+        chemin_lot = os.path.join(DOSSIER_LOTS, f"{cle_lot[:24]}.zip")
+        if st.button("🎒 Générer le lot"):
+            if os.path.exists(chemin_lot) and not forcer:
+                st.info("Ce lot a déjà été généré : il est prêt à être téléchargé.")
+            else:
+                barre = st.progress(0.0, text="Préparation du lot...")
+                try:
+                    resultat = generer_lot(
+                        client_generation, sujet, niveau, type_exo, nb, diff, nb_versions, chemin_lot,
+                        hors_ligne=hors_ligne, modele=MODELE,
+                        progression=lambda faites, total: barre.progress(faites / total, text=f"{faites}/{total} versions")
+                    )
+                    if resultat["echecs"]:
+                        st.warning(
+                            f"⚠️ {len(resultat['echecs'])} version(s) en échec. Relance : seules les versions "
+                            "manquantes seront générées."
+                        )
+                    elif resultat["reprises"]:
+                        st.success(f"✅ Lot terminé ({resultat['reprises']} versions reprises d'un essai précédent)")
+                    else:
+                        st.success(f"✅ {nb_versions} versions générées")
+                except LotEnCours:
+                    st.info("⏳ Ce lot est déjà en cours de génération (autre session) : réessaie dans un moment.")
+                except Exception as e:
+                    st.error(f"Erreur API : {e}")
+        if os.path.exists(chemin_lot):
+            with open(chemin_lot, "rb") as archive:
+                st.download_button(
+                    "📦 Télécharger le lot (ZIP)", archive, f"fiches_{nb_versions}_versions.zip", "application/zip"
+                )
+
+# --- ONGLET 3 : MÉTRIQUES (admin) ---
+if admin:
+    with onglets[2]:
+        registre = obtenir_registre()
+        st.header("📊 Où passe le temps ?")
+        st.caption(
+            f"Centiles sur les {registre.fenetre} dernières mesures de chaque étape (tous utilisateurs du processus). "
+            "Journal détaillé : METRIQUES_PATH (JSONL) · Prometheus (si METRIQUES_PORT est défini) : "
+            "GET /metrics sur METRIQUES_HOTE (127.0.0.1 par défaut)."
+        )
+        st.dataframe(registre.tableau(), hide_index=True, use_container_width=True)
+        col_tokens, col_traces = st.columns(2)
+        with col_tokens:
+            st.subheader("🔢 Tokens")
+            st.dataframe([{"type": k, "total": v} for k, v in registre.tokens.items()], hide_index=True)
+        with col_traces:
+            st.subheader("🧾 Actions")
+            st.dataframe(
+                [{"action": nom, **compte} for nom, compte in sorted(registre.traces.items())], hide_index=True
+            )
+        with st.expander("Format Prometheus"):
+            st.code(registre.prometheus(), language="text")
+
+# 5. MESURE DU TEMPS D'EXÉCUTION DU SCRIPT
+# ------------------------------------------------------------------
+# Pour vérifier que le temps d'un rerun ne grandit plus avec la longueur de la conversation.
+duree_script = time.perf_counter() - _T_DEBUT
+processus = infos_processus()
+if processus["demarrage"] is None:
+    processus["demarrage"] = duree_script
+if "durees_rerun" not in st.session_state:
+    st.session_state.durees_rerun = []
+st.session_state.durees_rerun.append((len(st.session_state.messages), duree_script))
+del st.session_state.durees_rerun[:-50]
+
+with st.sidebar.expander("⏱️ Performances"):
+    st.caption(f"Démarrage (1er passage du processus) : {processus['demarrage'] * 1000:.0f} ms")
+    st.caption(f"Dernier rerun : {duree_script * 1000:.0f} ms ({len(st.session_state.messages) - 1} messages)")
+    st.dataframe(
+        [{"messages": n - 1, "rerun (ms)": round(d * 1000, 1)} for n, d in st.session_state.durees_rerun[-10:]],
+        hide_index=True
+    )
+    questions = obtenir_cache_questions().metriques()
+    st.caption(
+        f"Cache de questions : {questions['hits']} réponses servies / {questions['misses']} non trouvées "
+        f"({questions['entrees']} entrées)"
+    )
+    coalescence = obtenir_coalesceur().metriques()
+    st.caption(
+        f"Fiches mutualisées : {coalescence['coalescees']} demandes greffées sur "
+        f"{coalescence['lancees']} générations ({coalescence['en_cours']} en cours, "
+        f"{coalescence['annulees']} annulées)"
+    )
+    # File d'attente des appels LLM (tout le processus, toutes sessions confondues)
+    st.dataframe(
+        [
+            {"budget": nom, "en cours": m["en_cours"], "en attente": m["en_attente"],
+             "max": m["max_simultanes"], "attente p95 (ms)": round(m["attente_p95"] * 1000),
+             "relances": m["relances"], "erreurs": m["erreurs"] + m["refus"]}
+            for nom, m in passerelle.metriques().items()
+        ],
+        hide_index=True
+    )
@@ -0,0 +1,76 @@
+"""
+Benchmark du cache de questions du tuteur (cache_questions.py).
+
+    python benchmarks/bench_cache_questions.py
+    python benchmarks/bench_cache_questions.py --entrees 100000 --requetes 5000
+
+Remplit le cache avec des questions synthétiques ("c'est quoi la dérivée de exp(12x)"...),
+puis mesure la latence de recherche (p50 / p95 / p99) pour des reformulations de questions
+présentes (doivent être trouvées) et des questions absentes (ne doivent pas l'être).
+Objectif : < 1 ms à 100 000 entrées.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_questions import CacheQuestions
+
+SUJETS = ["dérivée", "primitive", "limite", "intégrale", "signe", "variations", "tangente", "racines", "équation"]
+FONCTIONS = ["exp({a}x)", "ln(x^{a}+{b})", "x^{a}-{b}x", "\\frac{{{a}}}{{x+{b}}}", "cos({a}x)", "\\sqrt{{x+{a}}}",
+             "e^{{-{a}x}}"]
+DEBUTS = ["c'est quoi la", "comment calculer la", "je comprends pas la", "aide moi pour la", "", "peux tu m'expliquer la"]
+REFORMULATIONS = [("c'est quoi la", "C'est quoi la"), ("comment calculer la", "comment calculer une"),
+                  ("je comprends pas la", "je comprends pas la"), ("aide moi pour la", "aide moi pour cette")]
+
+
+def question(rng, i):
+    fonction = rng.choice(FONCTIONS).format(a=rng.randint(1, 50), b=rng.randint(1, 50))
+    return f"{rng.choice(DEBUTS)} {rng.choice(SUJETS)} de {fonction} ? ({i})"
+
+
+def centile(valeurs, p):
+    return valeurs[max(0, math.ceil(p / 100 * len(valeurs)) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entrees", type=int, default=100_000)
+    parser.add_argument("--requetes", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cache = CacheQuestions(taille_max=args.entrees)
+    t0 = time.perf_counter()
+    questions = [question(rng, i) for i in range(args.entrees)]
+    for i, q in enumerate(questions):
+        cache.ajouter(q, f"réponse {i}")
+    print(f"Remplissage : {len(cache)} entrées en {time.perf_counter() - t0:.1f} s")
+
+    for nom, generer in [
+        ("reformulées", lambda: _reformuler(rng, rng.choice(questions))),
+        ("absentes", lambda: question(rng, args.entrees + rng.randrange(10**6))),
+    ]:
+        durees, trouvees = [], 0
+        for _ in range(args.requetes):
+            q = generer()
+            t0 = time.perf_counter()
+            trouvees += cache.chercher(q) is not None
+            durees.append(time.perf_counter() - t0)
+        durees.sort()
+        print(f"{nom:<12} trouvées {trouvees:>5}/{args.requetes}  p50 {centile(durees, 50) * 1000:.3f} ms  "
+              f"p95 {centile(durees, 95) * 1000:.3f} ms  p99 {centile(durees, 99) * 1000:.3f} ms")
+
+
+def _reformuler(rng, q):
+    for avant, apres in REFORMULATIONS:
+        q = q.replace(avant, apres)
+    return q.replace(" ?", rng.choice(["", " ??", " svp"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Test de charge hors ligne : N sessions simulées (tuteur + générateur) contre le serveur factice.
+
+    python benchmarks/bench_charge.py --tuteurs 30 --generateurs 10
+    python benchmarks/bench_charge.py --url http://127.0.0.1:8765 --tuteurs 50 --tours 5
+
+Chaque session suit le même chemin de code que app.py (passerelle partagée, streaming,
+GestionnaireContexte pour le tuteur, ParseurFlux + generer_html_fiche pour le générateur).
+Rapport : latences p50 / p95 / p99 (1er token et totale), débit, erreurs, mémoire par session.
+Sans --url, un serveur factice est démarré dans le processus (voir serveur_factice.py).
+--client-brut : client OpenAI seul (sans limiteur ni backoff), pour comparer.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from contexte import GestionnaireContexte
+from parseur import ParseurFlux
+from passerelle import Passerelle
+from prompts import SYS_PROMPT_ASSISTANT, construire_prompt_fiche
+from rendu import generer_html_fiche
+import serveur_factice
+
+MODELE = "deepseek-chat"
+QUESTIONS = [
+    "c'est quoi la dérivée de exp(2x) ?",
+    "Comment on étudie le signe de $x^2 - 3x + 2$ ?",
+    "Je ne comprends pas la limite de $\\frac{\\ln x}{x}$ en $+\\infty$.",
+    "Tu peux me donner un exercice sur les suites géométriques ?",
+]
+
+
+class Mesures:
+    """Collecte thread-safe des durées (en secondes) par type de requête."""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.durees = {}
+        self.erreurs = 0
+        self.tokens = 0
+
+    def ajouter(self, nom, duree):
+        with self.verrou:
+            self.durees.setdefault(nom, []).append(duree)
+
+    def erreur(self):
+        with self.verrou:
+            self.erreurs += 1
+
+
+def centile(valeurs, p):
+    """Centile par la méthode du rang le plus proche."""
+    valeurs = sorted(valeurs)
+    if not valeurs:
+        return float("nan")
+    return valeurs[max(0, math.ceil(p / 100 * len(valeurs)) - 1)]
+
+
+def _streamer(client, messages, mesures, nom, **options):
+    """Appel en streaming ; enregistre ttft et durée totale. Renvoie les morceaux de texte."""
+    t0 = time.perf_counter()
+    premier = None
+    flux = client.chat.completions.create(
+        model=MODELE, messages=messages, stream=True, stream_options={"include_usage": True}, **options
+    )
+    for chunk in flux:
+        if getattr(chunk, "usage", None):
+            with mesures.verrou:
+                mesures.tokens += chunk.usage.completion_tokens
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        if premier is None:
+            premier = time.perf_counter() - t0
+            mesures.ajouter(f"{nom} 1er token", premier)
+        yield chunk.choices[0].delta.content
+    mesures.ajouter(f"{nom} total", time.perf_counter() - t0)
+
+
+def session_tuteur(client, mesures, tours, rng):
+    etat = {"messages": [{"role": "system", "content": SYS_PROMPT_ASSISTANT}], "contexte": GestionnaireContexte()}
+    for _ in range(tours):
+        etat["messages"].append({"role": "user", "content": rng.choice(QUESTIONS)})
+        try:
+            envoi = etat["contexte"].messages_a_envoyer(client, etat["messages"])
+            reponse = "".join(_streamer(client, envoi, mesures, "tuteur", temperature=0.4))
+            etat["messages"].append({"role": "assistant", "content": reponse})
+        except Exception:
+            mesures.erreur()
+            etat["messages"].pop()
+    return etat
+
+
+def session_generateur(client, mesures, tours, rng):
+    etat = {}
+    for _ in range(tours):
+        nb = rng.randint(3, 10)
+        prompt = construire_prompt_fiche("Fonctions exponentielles", "Terminale", "Exercices classiques", nb, 3)
+        try:
+            parseur = ParseurFlux()
+            messages = [{"role": "system", "content": prompt}, {"role": "user", "content": "Génère la fiche."}]
+            for morceau in _streamer(client, messages, mesures, "fiche", temperature=0.2, max_tokens=8000):
+                parseur.ajouter(morceau)
+            parseur.terminer()
+            t0 = time.perf_counter()
+            data = parseur.resultat()
+            etat["data"], etat["html"] = data, generer_html_fiche(data["titre"], data["exercices"], memoiser=True)
+            mesures.ajouter("rendu html", time.perf_counter() - t0)
+        except Exception:
+            mesures.erreur()
+    return etat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="serveur compatible OpenAI déjà lancé (sinon serveur factice interne)")
+    parser.add_argument("--tuteurs", type=int, default=20, help="sessions tuteur simultanées")
+    parser.add_argument("--generateurs", type=int, default=5, help="sessions générateur simultanées")
+    parser.add_argument("--tours", type=int, default=3, help="requêtes par session")
+    parser.add_argument("--latence", type=float, default=0.3)
+    parser.add_argument("--tokens-par-seconde", type=float, default=200.0)
+    parser.add_argument("--taux-erreur", type=float, default=0.0)
+    parser.add_argument("--retries", type=int, default=2, help="max_retries du client OpenAI (--client-brut)")
+    parser.add_argument("--client-brut", action="store_true", help="sans passerelle (ni limiteur ni backoff)")
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        _, url = serveur_factice.demarrer(
+            latence=args.latence, tokens_par_seconde=args.tokens_par_seconde, taux_erreur=args.taux_erreur
+        )
+    # Une seule passerelle partagée, comme dans app.py (st.cache_resource)
+    passerelle = None
+    if args.client_brut:
+        clients = [OpenAI(api_key="factice", base_url=url, max_retries=args.retries)] * 2
+    else:
+        passerelle = Passerelle(api_key="factice", base_url=url)
+        clients = [passerelle.pour("chat"), passerelle.pour("generation")]
+    mesures = Mesures()
+    nb_sessions = args.tuteurs + args.generateurs
+
+    tracemalloc.start()
+    memoire_depart = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, nb_sessions)) as pool:
+        futures = [
+            pool.submit(session, clients[session is session_generateur], mesures, args.tours, random.Random(i))
+            for i, session in enumerate([session_tuteur] * args.tuteurs + [session_generateur] * args.generateurs)
+        ]
+        etats = [f.result() for f in futures]
+    duree = time.perf_counter() - t0
+    # États des sessions encore vivants : mémoire retenue ≈ ce que garderait st.session_state
+    memoire_retenue, memoire_pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    nb_requetes = sum(len(v) for k, v in mesures.durees.items() if k.endswith("total"))
+    print(f"Serveur : {url} | sessions : {args.tuteurs} tuteur + {args.generateurs} générateur | {duree:.1f} s")
+    print(f"{'mesure':<20} {'n':>5} {'p50 (s)':>9} {'p95 (s)':>9} {'p99 (s)':>9}")
+    for nom, valeurs in sorted(mesures.durees.items()):
+        print(f"{nom:<20} {len(valeurs):>5} {centile(valeurs, 50):>9.3f} "
+              f"{centile(valeurs, 95):>9.3f} {centile(valeurs, 99):>9.3f}")
+    print(f"Débit : {nb_requetes / duree:.2f} requêtes/s, {mesures.tokens / duree:.0f} tokens/s | erreurs : {mesures.erreurs}")
+    if passerelle:
+        for nom, m in passerelle.metriques().items():
+            print(f"Passerelle {nom} : {m['total']} appels, attente p50 {m['attente_p50']:.3f} s / "
+                  f"p95 {m['attente_p95']:.3f} s, {m['relances']} relances, {m['erreurs'] + m['refus']} échecs")
+    if nb_sessions:
+        print(f"Mémoire par session : {(memoire_retenue - memoire_depart) / nb_sessions / 1024:.1f} Ko retenus, "
+              f"pic total {memoire_pic / 1024 / 1024:.1f} Mo")
+    del etats
+    return 1 if mesures.erreurs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
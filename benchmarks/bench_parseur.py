@@ -0,0 +1,161 @@
+"""
+Benchmark du parseur du format maison (temps + allocations).
+
+    python benchmarks/bench_parseur.py
+    python benchmarks/bench_parseur.py --tailles 1 50 500 --repetitions 20
+
+Sorties synthétiques de 1 à 500 exercices, propres ou "sales" (clés en gras,
+DIFFICULTE manquante, balises ``` parasites, titres #). Compare :
+  - reference : l'ancien parseur (10 re.sub globaux + 4/5 re.search par bloc)
+  - batch     : parser_format_maison actuel
+  - flux      : ParseurFlux alimenté par morceaux de quelques caractères (comme le stream)
+et vérifie que les trois donnent exactement le même résultat.
+Seule différence connue, absente des sorties générées ici : si "===NOUVEL_EXERCICE===" est sur
+la même ligne que TITRE_FICHE, la référence garde le marqueur (et la suite) dans le titre, le
+parseur actuel arrête le titre au marqueur.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parseur import ParseurFlux, parser_format_maison
+
+
+def parser_reference(texte_brut):
+    """Ancienne implémentation (avant le tokenizer en un passage), gardée comme référence."""
+    data = {"titre": "Fiche de Mathématiques", "exercices": []}
+    texte_clean = texte_brut.replace("```text", "").replace("```", "")
+    for key in ["TITRE_FICHE", "QUESTION", "REPONSE", "DETAIL", "DIFFICULTE"]:
+        texte_clean = re.sub(fr"\**{key}\**\s*:", f"{key}:", texte_clean, flags=re.IGNORECASE)
+        texte_clean = re.sub(fr"\#{key}", f"{key}", texte_clean, flags=re.IGNORECASE)
+
+    titre_match = re.search(r"TITRE_FICHE\s*:\s*(.*)", texte_clean, re.IGNORECASE)
+    if titre_match:
+        data["titre"] = titre_match.group(1).strip()
+
+    for bloc in re.split(r"===NOUVEL_EXERCICE===", texte_clean):
+        if not bloc.strip() or "TITRE_FICHE" in bloc: continue
+        exo = {"question": "", "reponse": "", "correction_detaillee": "", "difficulte": 3}
+        q_match = re.search(r"QUESTION\s*:\s*(.*?)\s*REPONSE\s*:", bloc, re.DOTALL | re.IGNORECASE)
+        r_match = re.search(r"REPONSE\s*:\s*(.*?)\s*DETAIL\s*:", bloc, re.DOTALL | re.IGNORECASE)
+        d_match = re.search(r"DETAIL\s*:\s*(.*?)\s*DIFFICULTE\s*:", bloc, re.DOTALL | re.IGNORECASE)
+        diff_match = re.search(r"DIFFICULTE\s*:\s*(\d)", bloc, re.IGNORECASE)
+        if d_match:
+            exo["correction_detaillee"] = d_match.group(1).strip()
+        else:
+            fallback = re.search(r"DETAIL\s*:\s*(.*)", bloc, re.DOTALL | re.IGNORECASE)
+            if fallback:
+                exo["correction_detaillee"] = fallback.group(1).strip()
+        if q_match: exo["question"] = q_match.group(1).strip()
+        if r_match: exo["reponse"] = r_match.group(1).strip()
+        if diff_match: exo["difficulte"] = int(diff_match.group(1))
+        if exo["question"]:
+            data["exercices"].append(exo)
+    return data
+
+
+# 1. SORTIES SYNTHÉTIQUES
+# ------------------------------------------------------------------
+ENONCE = (
+    "On considère la fonction $f$ définie sur $\\mathbb{R}$ par $f(x) = (2x+1)e^{-x}$.\n\n"
+    "1.a Calculer $f'(x)$.\n\n1.b En déduire le tableau de variations de $f$.\n\n"
+    "$$\n\\begin{array}{c|ccccc}\nx & -\\infty & & 1/2 & & +\\infty \\\\ \\hline\n"
+    "f'(x) & & + & 0 & - &\n\\end{array}\n$$\n"
+)
+DETAIL = (
+    "On dérive un produit : $f'(x) = 2e^{-x} - (2x+1)e^{-x}$\n\n"
+    "$$f'(x) = (1-2x)e^{-x}$$\n\nComme $e^{-x} > 0$, $f'(x)$ est du signe de $1-2x$.\n"
+)
+
+
+def _cle(rng, cle, sale):
+    if not sale:
+        return f"{cle}:"
+    return rng.choice([f"{cle}:", f"**{cle}**:", f"**{cle}** :", f"#{cle}:", f"{cle.lower()} :", f"*{cle}*:"])
+
+
+def sortie_synthetique(nb, sale=False, graine=0):
+    """Texte au format maison avec `nb` exercices ; `sale` ajoute les défauts vus en production."""
+    rng = random.Random(graine)
+    lignes = []
+    if sale:
+        lignes.append("```text")
+    lignes.append(f"{_cle(rng, 'TITRE_FICHE', sale)} Fonctions exponentielles\n")
+    for i in range(nb):
+        lignes.append("===NOUVEL_EXERCICE===")
+        lignes.append(f"{_cle(rng, 'QUESTION', sale)} Exercice {i + 1}. {ENONCE}")
+        lignes.append(f"{_cle(rng, 'REPONSE', sale)} $f'(x) = (1-2x)e^{{-x}}$")
+        lignes.append(f"{_cle(rng, 'DETAIL', sale)} {DETAIL}")
+        if not (sale and rng.random() < 0.2):  # DIFFICULTE oubliée
+            lignes.append(f"{_cle(rng, 'DIFFICULTE', sale)} {rng.randint(1, 5)}\n")
+        if sale and rng.random() < 0.1:
+            lignes.append("```")
+    if sale:
+        lignes.append("```")
+    return "\n".join(lignes)
+
+
+# 2. MESURES
+# ------------------------------------------------------------------
+def parser_flux(texte, taille_morceau=4):
+    parseur = ParseurFlux()
+    for i in range(0, len(texte), taille_morceau):
+        parseur.ajouter(texte[i:i + taille_morceau])
+    parseur.terminer()
+    return parseur.resultat()
+
+
+PARSEURS = {
+    "reference": parser_reference,
+    "batch": parser_format_maison,
+    "flux": parser_flux,
+}
+
+
+def mesurer(fonction, texte, repetitions):
+    """Renvoie (meilleur temps en ms, pic d'allocation mémoire en Ko)."""
+    meilleur = float("inf")
+    for _ in range(repetitions):
+        t0 = time.perf_counter()
+        fonction(texte)
+        meilleur = min(meilleur, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fonction(texte)
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return meilleur * 1000, pic / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tailles", type=int, nargs="+", default=[1, 10, 50, 100, 500])
+    parser.add_argument("--repetitions", type=int, default=10)
+    args = parser.parse_args()
+
+    ecarts = 0
+    print(f"{'exos':>5} {'sale':>5} {'parseur':>10} {'ms':>10} {'pic Ko':>10} {'x ref':>7}")
+    for nb in args.tailles:
+        for sale in (False, True):
+            texte = sortie_synthetique(nb, sale=sale, graine=nb)
+            attendu = parser_reference(texte)
+            temps_ref = None
+            for nom, fonction in PARSEURS.items():
+                if fonction(texte) != attendu:
+                    ecarts += 1
+                    print(f"!! {nom} diffère de la référence ({nb} exos, sale={sale})")
+                ms, pic = mesurer(fonction, texte, args.repetitions)
+                temps_ref = temps_ref or ms
+                print(f"{nb:>5} {str(sale):>5} {nom:>10} {ms:>10.3f} {pic:>10.1f} {temps_ref / ms:>7.2f}")
+    return 1 if ecarts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Faux serveur DeepSeek / OpenAI (chat completions) pour tester l'application hors ligne.
+
+    python benchmarks/serveur_factice.py --port 8765 --latence 0.5 --tokens-par-seconde 80 --taux-erreur 0.05
+    DEEPSEEK_BASE_URL=http://127.0.0.1:8765 streamlit run app.py
+
+- POST /chat/completions (et /v1/chat/completions), avec ou sans stream=True
+- latence avant le 1er token, débit en tokens/s, taux d'erreurs 429/500 configurables
+- réponses "fiche" au format TITRE_FICHE / ===NOUVEL_EXERCICE=== quand le prompt système
+  le demande, réponse de tuteur sinon ; usage (tokens) renvoyé comme DeepSeek
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_parseur import sortie_synthetique
+
+REPONSE_TUTEUR = (
+    "Bonne question ! Pour dériver $f(x) = e^{2x}$, on utilise la formule $(e^{u})' = u'e^{u}$.\n\n"
+    "Ici $u(x) = 2x$ donc $u'(x) = 2$, et :\n\n$$f'(x) = 2e^{2x}$$\n\n"
+    "À toi : que vaut la dérivée de $g(x) = e^{-3x}$ ?"
+)
+
+
+class ConfigurationFactice:
+    def __init__(self, latence=0.3, tokens_par_seconde=100.0, taux_erreur=0.0, graine=None):
+        self.latence = latence
+        self.tokens_par_seconde = tokens_par_seconde
+        self.taux_erreur = taux_erreur
+        self.rng = random.Random(graine)
+        self.verrou = threading.Lock()
+        self.nb_requetes = 0
+
+    def tirer_erreur(self):
+        """None (pas d'erreur), 429 ou 500."""
+        with self.verrou:
+            self.nb_requetes += 1
+            if self.rng.random() >= self.taux_erreur:
+                return None
+            return self.rng.choice([429, 500])
+
+
+def _texte_reponse(messages):
+    systeme = next((m["content"] for m in messages if m["role"] == "system"), "")
+    if "===NOUVEL_EXERCICE===" not in systeme:
+        return REPONSE_TUTEUR
+    nb = re.search(r"(?:Générer|Génère)\s+(\d+)", systeme)
+    return sortie_synthetique(int(nb.group(1)) if nb else 5, sale=False, graine=len(systeme))
+
+
+def _decouper(texte, taille=4):
+    """Découpe en "tokens" d'environ 4 caractères (ordre de grandeur des vrais tokens)."""
+    return [texte[i:i + taille] for i in range(0, len(texte), taille)]
+
+
+def _usage(messages, tokens):
+    prompt = sum(len(m["content"]) for m in messages) // 4
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt + len(tokens),
+        "prompt_cache_hit_tokens": 0,
+        "prompt_cache_miss_tokens": prompt,
+    }
+
+
+def creer_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, comme l'API réelle
+
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, code, corps, entetes=None):
+            donnees = json.dumps(corps).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(donnees)))
+            for cle, valeur in (entetes or {}).items():
+                self.send_header(cle, valeur)
+            self.end_headers()
+            self.wfile.write(donnees)
+
+        def do_POST(self):
+            if self.path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+                self._json(404, {"error": {"message": "route inconnue"}})
+                return
+            requete = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+            erreur = config.tirer_erreur()
+            if erreur:
+                if erreur == 429:
+                    self._json(429, {"error": {"message": "Rate limit", "type": "rate_limit"}}, {"Retry-After": "1"})
+                else:
+                    self._json(500, {"error": {"message": "Erreur interne simulée", "type": "server_error"}})
+                return
+
+            messages = requete.get("messages", [])
+            tokens = _decouper(_texte_reponse(messages))
+            max_tokens = requete.get("max_tokens")
+            if max_tokens:
+                tokens = tokens[:max_tokens]
+            identifiant = f"chatcmpl-{uuid.uuid4().hex}"
+            modele = requete.get("model", "deepseek-chat")
+            time.sleep(config.latence)
+
+            if not requete.get("stream"):
+                time.sleep(len(tokens) / config.tokens_par_seconde)
+                self._json(200, {
+                    "id": identifiant, "object": "chat.completion", "created": int(time.time()), "model": modele,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                                 "finish_reason": "stop"}],
+                    "usage": _usage(messages, tokens),
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def envoyer(donnees):
+                ligne = f"data: {donnees}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(ligne):X}\r\n".encode() + ligne + b"\r\n")
+                self.wfile.flush()
+
+            def chunk(delta, finish_reason=None, usage=None):
+                corps = {
+                    "id": identifiant, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": modele,
+                    "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                if usage:
+                    corps["usage"] = usage
+                envoyer(json.dumps(corps))
+
+            try:
+                chunk({"role": "assistant", "content": ""})
+                for token in tokens:
+                    chunk({"content": token})
+                    time.sleep(1 / config.tokens_par_seconde)
+                chunk({}, finish_reason="stop")
+                if (requete.get("stream_options") or {}).get("include_usage"):
+                    chunk(None, usage=_usage(messages, tokens))
+                envoyer("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client parti (annulation)
+
+    return Handler
+
+
+def demarrer(port=0, **options):
+    """Démarre le serveur dans un thread. Renvoie (serveur, url de base)."""
+    serveur = ThreadingHTTPServer(("127.0.0.1", port), creer_handler(ConfigurationFactice(**options)))
+    serveur.daemon_threads = True
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    return serveur, f"http://127.0.0.1:{serveur.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latence", type=float, default=0.3, help="secondes avant le 1er token")
+    parser.add_argument("--tokens-par-seconde", type=float, default=100.0)
+    parser.add_argument("--taux-erreur", type=float, default=0.0, help="proportion de réponses 429/500")
+    args = parser.parse_args()
+    serveur = ThreadingHTTPServer(("127.0.0.1", args.port), creer_handler(ConfigurationFactice(
+        latence=args.latence, tokens_par_seconde=args.tokens_par_seconde, taux_erreur=args.taux_erreur
+    )))
+    print(f"Serveur factice sur http://127.0.0.1:{args.port}")
+    serveur.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# CACHE DISQUE DES FICHES GÉNÉRÉES (SQLite)
+# ------------------------------------------------------------------
+# Les profs redemandent souvent les mêmes fiches (même sujet / niveau / format...).
+# On garde les exercices parsés + le HTML rendu, indexés par un hash des paramètres,
+# du prompt système et du modèle. Le fichier SQLite est partagé entre les sessions
+# Streamlit et entre les processus (mode WAL).
+
+CHEMIN_PAR_DEFAUT = os.getenv("FICHES_CACHE_PATH", os.path.join(".cache", "fiches.sqlite3"))
+
+
+def cle_fiche(parametres, prompt_systeme, modele):
+    """Clé de contenu : sha256 des paramètres + prompt rendu + nom du modèle."""
+    contenu = json.dumps(
+        {"parametres": parametres, "prompt": prompt_systeme, "modele": modele},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(contenu.encode("utf-8")).hexdigest()
+
+
+class CacheFiches:
+    """
+    Cache LRU borné en nombre d'entrées, avec durée de vie (TTL) en secondes.
+    Une connexion par appel : utilisable depuis plusieurs threads / processus.
+    """
+
+    def __init__(self, chemin=CHEMIN_PAR_DEFAUT, taille_max=500, ttl=30 * 24 * 3600):
+        self.chemin = chemin
+        self.taille_max = taille_max
+        self.ttl = ttl
+        dossier = os.path.dirname(chemin)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        with self._connexion() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fiches (
+                    cle TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    html TEXT NOT NULL,
+                    cree_le REAL NOT NULL,
+                    utilise_le REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_fiches_utilise ON fiches (utilise_le)")
+
+    @contextmanager
+    def _connexion(self):
+        # sqlite3.Connection en "with" ne fait que commit : on ferme explicitement
+        conn = sqlite3.connect(self.chemin, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def lire(self, cle):
+        """Renvoie (data, html) si la fiche est en cache et pas expirée, sinon None."""
+        maintenant = time.time()
+        with self._connexion() as conn:
+            ligne = conn.execute(
+                "SELECT data, html, cree_le FROM fiches WHERE cle = ?", (cle,)
+            ).fetchone()
+            if ligne is None:
+                return None
+            data, html, cree_le = ligne
+            if maintenant - cree_le > self.ttl:
+                conn.execute("DELETE FROM fiches WHERE cle = ?", (cle,))
+                return None
+            conn.execute("UPDATE fiches SET utilise_le = ? WHERE cle = ?", (maintenant, cle))
+        return json.loads(data), html
+
+    def ecrire(self, cle, data, html):
+        maintenant = time.time()
+        with self._connexion() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO fiches (cle, data, html, cree_le, utilise_le) VALUES (?, ?, ?, ?, ?)",
+                (cle, json.dumps(data, ensure_ascii=False), html, maintenant, maintenant)
+            )
+            self._evincer(conn, maintenant)
+
+    def _evincer(self, conn, maintenant):
+        # 1. Entrées expirées  2. Au-delà de taille_max : les moins récemment utilisées
+        conn.execute("DELETE FROM fiches WHERE cree_le < ?", (maintenant - self.ttl,))
+        conn.execute("""
+            DELETE FROM fiches WHERE cle IN (
+                SELECT cle FROM fiches ORDER BY utilise_le DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.taille_max,))
+
+    def supprimer(self, cle):
+        with self._connexion() as conn:
+            conn.execute("DELETE FROM fiches WHERE cle = ?", (cle,))
+
+    def __len__(self):
+        with self._connexion() as conn:
+            return conn.execute("SELECT COUNT(*) FROM fiches").fetchone()[0]
@@ -0,0 +1,232 @@
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# CACHE DE RÉPONSES PAR SIMILARITÉ (1re question d'une conversation)
+# ------------------------------------------------------------------
+# Dans une même classe, les élèves posent presque la même question ("c'est quoi la dérivée
+# de exp(2x)", "dérivée exp 2x ?"). Pour le 1er tour, la réponse ne dépend que de la
+# question (le prompt système est fixe) : on peut resservir une réponse déjà générée.
+#
+#   1. normalisation : minuscules, sans accents, LaTeX simplifié ($, \frac, e^{...}...),
+#      mots vides retirés
+#   2. garde-fou : nombres, fonctions et opérateurs doivent être identiques
+#      ("exp(2x)" et "exp(3x)" sont très proches en n-grammes mais n'ont pas la même réponse)
+#   3. TF-IDF sur les trigrammes de caractères, index inversé en tableaux NumPy :
+#      les candidats sont scorés en un np.bincount (les trigrammes trop fréquents, peu
+#      informatifs, sont ignorés à cette étape), puis les meilleurs sont rescorés exactement
+#      (cosinus) avec l'IDF courant. Réponse servie si cosinus >= seuil.
+#   4. taille bornée : emplacements réutilisés, éviction LRU
+# NumPy n'est importé qu'au 1er ajout (pas au démarrage de l'application, cf. latex_svg.py).
+
+SEUIL_PAR_DEFAUT = float(os.getenv("TUTEUR_CACHE_SEUIL", "0.92"))
+TAILLE_PAR_DEFAUT = int(os.getenv("TUTEUR_CACHE_TAILLE", "20000"))
+
+MOTS_VIDES = frozenset("""
+    a au aux avec c ca ce ces cest d de des du en est et il j je l la le les m me mon ma mes moi
+    n ne on ou par pas peux peut pour qu que quoi qui s sa se ses si son sur t ta te tes toi ton
+    tu un une vous quel quelle quels quelles svp stp merci bonjour salut donne donner explique
+    expliquer calcule calculer
+""".split())
+FONCTIONS = ("arccos", "arcsin", "arctan", "sqrt", "racine", "exp", "ln", "log", "sin", "cos", "tan")
+
+_RE_DELIMITEURS = re.compile(r"\$+|\\[()\[\]]|\\left|\\right|\\[,;!]")
+_RE_FRAC = re.compile(r"\\[dt]?frac\s*\{([^{}]*)\}\s*\{([^{}]*)\}")
+_RE_EXP = re.compile(r"\be\s*\^")
+_RE_COMMANDE = re.compile(r"\\([a-z]+)")
+_RE_NON_MOT = re.compile(r"[^a-z0-9+\-*/^=<>]+")
+_RE_JETONS_MATHS = re.compile(r"\d+(?:[.,]\d+)?|[+\-*/^=<>]|\b(?:" + "|".join(FONCTIONS) + r")\b")
+_SYNONYMES = [
+    (re.compile(r"\b(?:infty|inf)\b"), "infini"),
+    (re.compile(r"\bplus\s+(?:l\s+)?infini"), "+infini"),
+    (re.compile(r"\bmoins\s+(?:l\s+)?infini"), "-infini"),
+    (re.compile(r"\bkoi\b"), "quoi"),
+]
+_RE_COLLE = re.compile(r"(?<=\d)(?=[a-z])|(?<=[a-z])(?=\d)|(?=[+\-*/^=<>])|(?<=[+\-*/^=<>])")
+
+_NUMPY = None
+
+
+def _numpy():
+    """Import paresseux de NumPy, une seule fois par processus."""
+    global _NUMPY
+    if _NUMPY is None:
+        import numpy
+        _NUMPY = numpy
+    return _NUMPY
+
+
+def normaliser_question(texte):
+    """Forme canonique d'une question (français + LaTeX) pour la comparaison."""
+    texte = texte.lower().replace("²", "^2").replace("³", "^3")
+    texte = unicodedata.normalize("NFKD", texte)
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    texte = texte.replace("'", " ").replace("’", " ").replace("**", "^")
+    texte = _RE_DELIMITEURS.sub(" ", texte)
+    texte = _RE_FRAC.sub(r"(\1)/(\2)", texte)
+    texte = _RE_COMMANDE.sub(r" \1 ", texte)  # \exp -> exp, \ln -> ln, \sqrt -> sqrt...
+    texte = _RE_EXP.sub(" exp ", texte)  # e^{2x} -> exp 2x
+    for motif, remplacement in _SYNONYMES:
+        texte = motif.sub(remplacement, texte)
+    texte = _RE_NON_MOT.sub(" ", texte)  # parenthèses, accolades, ponctuation
+    texte = _RE_COLLE.sub(" ", texte)  # 2x -> 2 x, x^2 -> x ^ 2
+    return " ".join(mot for mot in texte.split() if mot not in MOTS_VIDES)
+
+
+def signature(texte_normalise):
+    """Nombres, fonctions et opérateurs (multiensemble) : doivent coïncider pour resservir."""
+    return tuple(sorted(_RE_JETONS_MATHS.findall(texte_normalise)))
+
+
+def trigrammes(texte_normalise):
+    """{trigramme: poids tf sous-linéaire} sur le texte bordé d'espaces."""
+    texte = f" {texte_normalise} "
+    compte = {}
+    for i in range(len(texte) - 2):
+        g = texte[i:i + 3]
+        compte[g] = compte.get(g, 0) + 1
+    return {g: 1 + math.log(n) for g, n in compte.items()}
+
+
+class _Postings:
+    """Liste des emplacements contenant un trigramme (tableau NumPy à doublement de capacité)."""
+
+    __slots__ = ("emplacements", "poids", "n")
+
+    def __init__(self):
+        np = _numpy()
+        self.emplacements = np.empty(8, dtype=np.int32)
+        self.poids = np.empty(8, dtype=np.float32)
+        self.n = 0
+
+    def ajouter(self, emplacement, poids):
+        if self.n == len(self.emplacements):
+            np = _numpy()
+            self.emplacements = np.resize(self.emplacements, 2 * self.n)
+            self.poids = np.resize(self.poids, 2 * self.n)
+        self.emplacements[self.n] = emplacement
+        self.poids[self.n] = poids
+        self.n += 1
+
+    def retirer(self, emplacement):
+        i = _numpy().flatnonzero(self.emplacements[:self.n] == emplacement)
+        if len(i):
+            dernier = self.n - 1
+            self.emplacements[i[0]] = self.emplacements[dernier]
+            self.poids[i[0]] = self.poids[dernier]
+            self.n = dernier
+
+
+class CacheQuestions:
+    def __init__(self, taille_max=TAILLE_PAR_DEFAUT, seuil=SEUIL_PAR_DEFAUT, df_max=0.02, candidats=8):
+        self.taille_max = taille_max
+        self.seuil = seuil
+        self.df_max = df_max  # trigrammes présents dans plus de 2 % des entrées : ignorés au 1er tri
+        self.candidats = candidats
+        self._verrou = threading.Lock()
+        self._postings = {}  # trigramme -> _Postings
+        self._entrees = [None] * taille_max  # emplacement -> (texte normalisé, signature, réponse)
+        self._libres = list(range(taille_max - 1, -1, -1))
+        self._lru = OrderedDict()  # emplacement -> None (du moins au plus récemment utilisé)
+        self._exactes = {}  # texte normalisé -> emplacement (question identique : pas de calcul)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._lru)
+
+    def _idf(self, g):
+        postings = self._postings.get(g)
+        return math.log((1 + len(self._lru)) / (1 + (postings.n if postings else 0))) + 1
+
+    def _vecteur(self, texte_normalise):
+        """Vecteur TF-IDF normé (dict trigramme -> poids) avec l'IDF courant."""
+        poids = {g: tf * self._idf(g) for g, tf in trigrammes(texte_normalise).items()}
+        norme = math.sqrt(sum(p * p for p in poids.values())) or 1.0
+        return {g: p / norme for g, p in poids.items()}
+
+    def _candidats(self, vecteur):
+        """Emplacements les plus prometteurs (score approché, trigrammes fréquents ignorés)."""
+        limite = max(16, self.df_max * len(self._lru))
+        emplacements, poids = [], []
+        for g, q in vecteur.items():
+            postings = self._postings.get(g)
+            if postings is None or postings.n > limite:
+                continue
+            emplacements.append(postings.emplacements[:postings.n])
+            poids.append(postings.poids[:postings.n] * q)
+        if not emplacements:
+            return []
+        np = _numpy()
+        scores = np.bincount(np.concatenate(emplacements), weights=np.concatenate(poids),
+                             minlength=self.taille_max)
+        # argpartition sur tout le tableau (surtout des 0) est lent ; nonzero est bien plus rapide sur un masque
+        touches = np.flatnonzero(scores > 0)
+        if len(touches) > self.candidats:
+            touches = touches[np.argpartition(scores[touches], -self.candidats)[-self.candidats:]]
+        return touches.tolist()
+
+    def chercher(self, question):
+        """(réponse, similarité) si une question assez proche est en cache, sinon None."""
+        texte = normaliser_question(question)
+        if not texte:
+            return None
+        with self._verrou:
+            emplacement = self._exactes.get(texte)
+            if emplacement is not None:
+                self._lru.move_to_end(emplacement)
+                self.hits += 1
+                return self._entrees[emplacement][2], 1.0
+            sig = signature(texte)
+            vecteur = self._vecteur(texte)
+            meilleur, meilleur_score = None, 0.0
+            for emplacement in self._candidats(vecteur):
+                texte_c, sig_c, _ = self._entrees[emplacement]
+                if sig_c != sig:
+                    continue
+                vecteur_c = self._vecteur(texte_c)
+                score = sum(p * vecteur_c.get(g, 0.0) for g, p in vecteur.items())
+                if score > meilleur_score:
+                    meilleur, meilleur_score = emplacement, score
+            if meilleur is None or meilleur_score < self.seuil:
+                self.misses += 1
+                return None
+            self._lru.move_to_end(meilleur)
+            self.hits += 1
+            return self._entrees[meilleur][2], meilleur_score
+
+    def ajouter(self, question, reponse):
+        texte = normaliser_question(question)
+        if not texte or not reponse:
+            return
+        with self._verrou:
+            if texte in self._exactes:
+                return
+            if not self._libres:
+                self._evincer(next(iter(self._lru)))
+            emplacement = self._libres.pop()
+            # Poids figés à l'insertion (IDF du moment) : ils ne servent qu'au 1er tri
+            for g, p in self._vecteur(texte).items():
+                self._postings.setdefault(g, _Postings()).ajouter(emplacement, p)
+            self._entrees[emplacement] = (texte, signature(texte), reponse)
+            self._exactes[texte] = emplacement
+            self._lru[emplacement] = None
+
+    def _evincer(self, emplacement):
+        texte = self._entrees[emplacement][0]
+        for g in trigrammes(texte):
+            postings = self._postings[g]
+            postings.retirer(emplacement)
+            if not postings.n:
+                del self._postings[g]
+        del self._exactes[texte]
+        del self._lru[emplacement]
+        self._entrees[emplacement] = None
+        self._libres.append(emplacement)
+
+    def metriques(self):
+        with self._verrou:
+            return {"entrees": len(self._lru), "hits": self.hits, "misses": self.misses}
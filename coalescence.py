@@ -0,0 +1,169 @@
+import threading
+
+# MUTUALISATION DES GÉNÉRATIONS IDENTIQUES EN COURS ("single-flight")
+# ------------------------------------------------------------------
+# Quand toute une classe demande la même fiche au même moment, le cache disque ne sert à
+# rien : aucune réponse n'est encore terminée. Ici, la 1re demande lance la génération
+# (dans un thread à part) ; les demandes identiques qui arrivent pendant ce temps
+# s'y abonnent et reçoivent les mêmes morceaux de texte (depuis le début) puis le même
+# résultat, ou la même erreur.
+#
+# Annulation : chaque session abonnée qui abandonne (rerun Streamlit, onglet fermé) se
+# désabonne ; quand il ne reste plus personne, la génération est arrêtée au morceau suivant
+# (la connexion et la place dans le limiteur de la passerelle sont libérées).
+
+
+class GenerationAnnulee(Exception):
+    """Plus aucune session n'attend cette génération."""
+
+
+class Vol:
+    """Une génération en cours, partagée par toutes les demandes de même clé."""
+
+    def __init__(self, cle):
+        self.cle = cle
+        self.morceaux = []
+        self.termine = False
+        self.annule = False
+        self.resultat = None
+        self.erreur = None
+        self.abonnes = 0
+        self.infos = {}  # mesures laissées par le producteur (usage, 1er token...)
+        self._condition = threading.Condition()
+
+    def publier(self, morceau):
+        """Appelé par le producteur pour chaque morceau de texte. Lève GenerationAnnulee si abandonnée."""
+        with self._condition:
+            if self.annule:
+                raise GenerationAnnulee(self.cle)
+            self.morceaux.append(morceau)
+            self._condition.notify_all()
+
+    def verifier_annulation(self):
+        """Pour un producteur qui ne publie pas de morceaux : lève GenerationAnnulee si abandonnée."""
+        with self._condition:
+            if self.annule:
+                raise GenerationAnnulee(self.cle)
+
+    def _finir(self, resultat=None, erreur=None):
+        with self._condition:
+            self.resultat, self.erreur, self.termine = resultat, erreur, True
+            self._condition.notify_all()
+
+
+class Abonnement:
+    """
+    Vue d'une session sur un Vol : itérer donne les morceaux de texte (tous, depuis le
+    début), resultat() attend la fin. À utiliser avec `with` pour se désabonner à coup sûr.
+    """
+
+    def __init__(self, coalesceur, vol, rejoint):
+        self._coalesceur = coalesceur
+        self._vol = vol
+        self.rejoint = rejoint  # True : on s'est greffé sur une génération déjà lancée
+        self._parti = False
+
+    @property
+    def infos(self):
+        return self._vol.infos
+
+    def __iter__(self):
+        vol = self._vol
+        position = 0
+        while True:
+            with vol._condition:
+                while position == len(vol.morceaux) and not vol.termine:
+                    vol._condition.wait()
+                nouveaux = vol.morceaux[position:]
+                fini = vol.termine
+            position += len(nouveaux)
+            yield from nouveaux
+            if fini and position == len(vol.morceaux):
+                return
+
+    def resultat(self):
+        vol = self._vol
+        with vol._condition:
+            while not vol.termine:
+                vol._condition.wait()
+        if vol.erreur is not None:
+            raise vol.erreur
+        return vol.resultat
+
+    def quitter(self):
+        if not self._parti:
+            self._parti = True
+            self._coalesceur._desabonner(self._vol)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.quitter()
+
+
+class Coalesceur:
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._en_vol = {}
+        self.lancees = 0
+        self.coalescees = 0
+        self.annulees = 0
+        self.erreurs = 0
+
+    def souscrire(self, cle, produire):
+        """
+        Abonnement à la génération `cle`, lancée si aucune n'est en cours.
+        produire(vol) fait l'appel LLM, passe chaque morceau à vol.publier(...) et
+        renvoie le résultat final (partagé tel quel : ne pas le modifier).
+        """
+        with self._verrou:
+            vol = self._en_vol.get(cle)
+            rejoint = vol is not None
+            if rejoint:
+                self.coalescees += 1
+            else:
+                vol = self._en_vol[cle] = Vol(cle)
+                self.lancees += 1
+            vol.abonnes += 1
+        if not rejoint:
+            threading.Thread(target=self._executer, args=(vol, produire), daemon=True).start()
+        return Abonnement(self, vol, rejoint)
+
+    def _executer(self, vol, produire):
+        try:
+            resultat, erreur = produire(vol), None
+        except GenerationAnnulee as e:
+            resultat, erreur = None, e
+        except Exception as e:
+            resultat, erreur = None, e
+            with self._verrou:
+                self.erreurs += 1
+        with self._verrou:
+            # Les demandes suivantes repartent de zéro (ou du cache disque)
+            if self._en_vol.get(vol.cle) is vol:
+                del self._en_vol[vol.cle]
+        vol._finir(resultat, erreur)
+
+    def _desabonner(self, vol):
+        with self._verrou:
+            vol.abonnes -= 1
+            if vol.abonnes > 0 or vol.termine:
+                return
+            # Plus personne n'attend : on retire le vol tout de suite (une nouvelle demande
+            # ne doit pas s'y greffer) et le producteur s'arrêtera au prochain morceau.
+            if self._en_vol.get(vol.cle) is vol:
+                del self._en_vol[vol.cle]
+            self.annulees += 1
+        with vol._condition:
+            vol.annule = True
+
+    def metriques(self):
+        with self._verrou:
+            return {
+                "en_cours": len(self._en_vol),
+                "lancees": self.lancees,
+                "coalescees": self.coalescees,
+                "annulees": self.annulees,
+                "erreurs": self.erreurs,
+            }
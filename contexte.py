@@ -0,0 +1,115 @@
+import os
+
+# GESTION DU CONTEXTE DU TUTEUR (budget de tokens)
+# ------------------------------------------------------------------
+# Sans gestion, chaque tour renvoie tout l'historique : taille, latence et coût
+# augmentent sans limite. Ici :
+#   [prompt système, identique à l'octet près]  -> le cache de préfixe DeepSeek continue de servir
+#   [résumé des anciens tours]                   -> recalculé seulement de temps en temps
+#   [derniers tours, mot pour mot]
+# Quand les tours récents dépassent le budget, on replie les plus anciens dans le résumé
+# en descendant assez bas (ratio_apres_repli) pour tenir plusieurs tours sans nouveau repli.
+
+BUDGET_PAR_DEFAUT = int(os.getenv("TUTEUR_BUDGET_TOKENS", "6000"))
+
+PROMPT_RESUME = """Tu résumes une conversation entre un élève et son professeur de mathématiques.
+Garde : le niveau de l'élève, les exercices/énoncés étudiés, les résultats obtenus (avec les formules en LaTeX $),
+les difficultés rencontrées et où en est l'explication. Français uniquement, 200 mots maximum, pas de préambule."""
+
+
+def estimer_tokens(texte):
+    """Estimation grossière (~3,5 caractères par token en français avec du LaTeX)."""
+    return len(texte) * 2 // 7 + 4
+
+
+def lire_usage(usage):
+    """
+    Extrait les compteurs de response.usage (ou du dernier chunk en streaming).
+    DeepSeek : prompt_cache_hit_tokens ; OpenAI : prompt_tokens_details.cached_tokens.
+    """
+    if usage is None:
+        return None
+    cache = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cache is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cache = getattr(details, "cached_tokens", None) or 0
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cache_hit_tokens": cache,
+        "completion_tokens": usage.completion_tokens,
+    }
+
+
+class GestionnaireContexte:
+    """
+    Construit la liste de messages à envoyer à partir de l'historique complet
+    (st.session_state.messages, qui reste intact pour l'affichage).
+    L'objet garde l'état du résumé : à stocker dans st.session_state.
+    """
+
+    def __init__(self, budget_tokens=BUDGET_PAR_DEFAUT, ratio_apres_repli=0.5, modele="deepseek-chat"):
+        self.budget_tokens = budget_tokens
+        self.ratio_apres_repli = ratio_apres_repli
+        self.modele = modele
+        self.resume = ""
+        self.nb_replies = 0  # nombre de messages (hors système) déjà repliés dans le résumé
+        self.nb_resumes = 0
+
+    def _message_resume(self):
+        return {"role": "system", "content": f"Résumé de la conversation précédente avec l'élève :\n{self.resume}"}
+
+    def _debut_fenetre(self, historique, budget):
+        """Indice du plus ancien message gardé mot pour mot pour tenir dans `budget`."""
+        total = 0
+        debut = len(historique)
+        for i in range(len(historique) - 1, self.nb_replies - 1, -1):
+            total += estimer_tokens(historique[i]["content"])
+            if total > budget and debut < len(historique):
+                break
+            debut = i
+        # On commence toujours la fenêtre sur une question de l'élève
+        while debut < len(historique) - 1 and historique[debut]["role"] != "user":
+            debut += 1
+        return debut
+
+    def _replier(self, client, messages_a_replier):
+        conversation = "\n\n".join(f"{m['role'].upper()} : {m['content']}" for m in messages_a_replier)
+        if self.resume:
+            conversation = f"RÉSUMÉ PRÉCÉDENT :\n{self.resume}\n\nSUITE DE LA CONVERSATION :\n{conversation}"
+        res = client.chat.completions.create(
+            model=self.modele,
+            messages=[
+                {"role": "system", "content": PROMPT_RESUME},
+                {"role": "user", "content": conversation}
+            ],
+            temperature=0.2,
+            max_tokens=500
+        )
+        self.resume = res.choices[0].message.content.strip()
+        self.nb_resumes += 1
+
+    def messages_a_envoyer(self, client, messages):
+        """
+        messages = historique complet, messages[0] = prompt système.
+        Renvoie la liste à passer à chat.completions.create.
+        """
+        systeme, historique = messages[0], messages[1:]
+        fixe = estimer_tokens(systeme["content"]) + (estimer_tokens(self.resume) if self.resume else 0)
+        budget = max(0, self.budget_tokens - fixe)
+
+        debut = self._debut_fenetre(historique, budget)
+        if debut > self.nb_replies:
+            # Dépassement : repli "large" pour ne pas résumer à chaque tour
+            debut = self._debut_fenetre(historique, int(budget * self.ratio_apres_repli))
+            try:
+                self._replier(client, historique[self.nb_replies:debut])
+                self.nb_replies = debut
+            except Exception:
+                # Résumé impossible (API...) : on envoie quand même la fenêtre récente
+                pass
+
+        envoi = [systeme]
+        if self.resume:
+            envoi.append(self._message_resume())
+        envoi.extend(historique[max(debut, self.nb_replies):])
+        return envoi
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from parseur import parser_format_maison, TITRE_PAR_DEFAUT
+
+# GÉNÉRATION PARALLÈLE (un appel LLM par exercice)
+# ------------------------------------------------------------------
+# Une fiche de N exercices en un seul appel = N fois le temps d'un exercice.
+# Ici on lance N requêtes concurrentes (pool borné), puis on fusionne dans l'ordre :
+# le temps total est proche de celui d'un seul exercice.
+
+
+def generer_un_exercice(client, prompt_systeme, modele="deepseek-chat"):
+    """Un appel = un exercice. Lève ValueError si la réponse n'est pas au bon format."""
+    response = client.chat.completions.create(
+        model=modele,
+        messages=[
+            {"role": "system", "content": prompt_systeme},
+            {"role": "user", "content": "Génère la fiche."}
+        ],
+        temperature=0.7,  # un peu plus haut qu'en mode fiche : on veut de la variété entre appels
+        max_tokens=2500
+    )
+    data = parser_format_maison(response.choices[0].message.content)
+    if not data["exercices"]:
+        raise ValueError("Réponse sans exercice exploitable")
+    return data["titre"], data["exercices"][0]
+
+
+def generer_fiche_parallele(client, construire_prompt, nb, max_workers=5, tentatives=3, modele="deepseek-chat",
+                            progression=None):
+    """
+    Génère une fiche de `nb` exercices en parallèle.
+    - construire_prompt(indice) -> prompt système de l'exercice `indice` (0..nb-1)
+    - seuls les exercices en échec sont relancés (jusqu'à `tentatives` fois au total)
+    - progression() est appelée après chaque appel terminé ; si elle lève une exception
+      (génération abandonnée), les appels pas encore partis sont annulés et l'exception remonte
+
+    Renvoie {"titre", "exercices", "manquants"} (compatible generer_html_fiche) ;
+    "manquants" liste les indices toujours en échec après toutes les tentatives.
+    Lève RuntimeError si aucun exercice n'a pu être généré.
+    """
+    resultats = {}
+    titres = {}
+    erreurs = {}
+    a_faire = list(range(nb))
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, nb)))
+    try:
+        for _ in range(tentatives):
+            if not a_faire:
+                break
+            futures = {
+                pool.submit(generer_un_exercice, client, construire_prompt(i), modele): i
+                for i in a_faire
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    titres[i], resultats[i] = future.result()
+                except Exception as e:
+                    erreurs[i] = e
+                if progression:
+                    progression()
+            a_faire = [i for i in a_faire if i not in resultats]
+    finally:
+        # Abandon : les appels en cours se terminent en arrière-plan, les autres ne partent pas
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if not resultats:
+        raise RuntimeError(f"Aucun exercice généré : {next(iter(erreurs.values()), 'erreur inconnue')}")
+
+    return {
+        "titre": titres[min(titres)] if titres else TITRE_PAR_DEFAUT,
+        "exercices": [resultats[i] for i in sorted(resultats)],
+        "manquants": a_faire,
+    }
@@ -0,0 +1,307 @@
+import ast
+import base64
+import io
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from latex_svg import prefixer_identifiants
+
+# COURBES DES EXERCICES (NumPy + matplotlib, rendu côté serveur)
+# ------------------------------------------------------------------
+# Le modèle peut ajouter à un exercice une ligne optionnelle
+#     GRAPHIQUE: x*exp(-x) ; 1 - x sur [-1 ; 5]
+# (une à trois expressions en syntaxe calculatrice, puis l'intervalle).
+#   - l'expression est analysée en AST et seule une liste blanche est acceptée
+#     (opérations, x, pi, e, exp/ln/sqrt/sin...) : jamais d'eval de texte arbitraire
+#   - évaluation vectorisée sur une grille NumPy ; les valeurs non finies (ln de négatif,
+#     division par 0) deviennent NaN et la courbe est coupée aux sauts (asymptotes)
+#   - tracé avec le backend Agg (pas d'écran sur le serveur), export SVG (ou PNG)
+#   - cache par (expressions, intervalle) ; tracés lancés dans un pool de threads dès que
+#     l'exercice est parsé, pour ne jamais retarder l'affichage du texte de la fiche
+
+NB_POINTS = 801
+DOMAINE_PAR_DEFAUT = (-5.0, 5.0)
+MAX_EXPRESSIONS = 3
+MAX_LONGUEUR = 200
+NOMS_COURBES = "fgh"
+
+# matplotlib n'est pas thread-safe : un seul tracé à la fois (l'évaluation NumPy, elle, est parallèle)
+_VERROU = threading.Lock()
+_MATPLOTLIB = None  # (Figure, numpy) une fois chargé, False si absent
+
+
+def _charger():
+    """Import paresseux de numpy / matplotlib (backend Agg). None si indisponibles."""
+    global _MATPLOTLIB
+    if _MATPLOTLIB is None:
+        try:
+            import matplotlib
+            matplotlib.use("Agg")
+            matplotlib.rcParams["svg.hashsalt"] = "graphiques"  # identifiants SVG stables (sinon aléatoires)
+            from matplotlib.figure import Figure
+            import numpy
+            _MATPLOTLIB = (Figure, numpy)
+        except ImportError:
+            _MATPLOTLIB = False
+    return _MATPLOTLIB or None
+
+
+# --- Analyse de la ligne GRAPHIQUE ---------------------------------
+
+_SUBSTITUTIONS = [
+    (re.compile(r"\$"), ""),
+    (re.compile(r"[−–]"), "-"),
+    (re.compile(r"[×·]|\\times|\\cdot"), "*"),
+    (re.compile(r"÷"), "/"),
+    (re.compile(r"²"), "^2"),
+    (re.compile(r"³"), "^3"),
+    (re.compile(r"√"), "sqrt"),
+    (re.compile(r"\\left|\\right"), ""),
+    (re.compile(r"\\[dt]?frac\s*\{([^{}]*)\}\s*\{([^{}]*)\}"), r"(\1)/(\2)"),
+    (re.compile(r"\\(?=[a-z])"), ""),  # \ln -> ln, \sqrt{...} -> sqrt{...}
+    (re.compile(r"\{"), "("),
+    (re.compile(r"\}"), ")"),
+    (re.compile(r"\be\s*\^\s*\("), "exp("),  # e^(2x) -> exp(2x)
+    (re.compile(r"\be\s*\^\s*(-?[\w.]+)"), r"exp(\1)"),  # e^-x -> exp(-x)
+    (re.compile(r"\^"), "**"),
+    (re.compile(r"(\d),(\d)"), r"\1.\2"),  # virgule décimale
+    (re.compile(r"(\d)\s*(?=[a-z(])"), r"\1*"),  # 2x, 3(x+1), 2exp(x)
+    (re.compile(r"\)\s*(?=[\w(])"), ")*"),  # (x+1)(x-1), (x+1)x
+    (re.compile(r"\bx\s*(?=[a-z(])"), "x*"),  # x(x+1), x exp(x)
+]
+_RE_DEFINITION = re.compile(r"^\s*[a-zA-Z]\w*\s*\(\s*x\s*\)\s*=\s*")
+_RE_INTERVALLE = [
+    re.compile(r"[\[\]]\s*([^;\[\]]+?)\s*;\s*([^;\[\]]+?)\s*[\[\]]"),
+    re.compile(r"[\[\]]\s*([^,;\[\]]+?)\s*,\s*([^,;\[\]]+?)\s*[\[\]]"),
+]
+_RE_AVANT_INTERVALLE = re.compile(r"\s*(?:sur|pour\s+x\s+dans|pour\s+x\s*∈|x\s*∈|dans)?\s*$", re.IGNORECASE)
+
+_FONCTIONS = {
+    "exp": "exp", "ln": "log", "log": "log10", "sqrt": "sqrt", "racine": "sqrt", "abs": "abs",
+    "sin": "sin", "cos": "cos", "tan": "tan", "arctan": "arctan", "arcsin": "arcsin", "arccos": "arccos",
+}
+_CONSTANTES = {"pi": "pi", "e": "e"}
+_OPERATEURS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+
+def _verifier(noeud):
+    """Liste blanche des nœuds de l'AST. Lève ValueError sinon."""
+    if isinstance(noeud, ast.Expression):
+        return _verifier(noeud.body)
+    if isinstance(noeud, ast.BinOp) and isinstance(noeud.op, _OPERATEURS):
+        return _verifier(noeud.left) and _verifier(noeud.right)
+    if isinstance(noeud, ast.UnaryOp) and isinstance(noeud.op, _OPERATEURS):
+        return _verifier(noeud.operand)
+    if isinstance(noeud, ast.Constant) and type(noeud.value) in (int, float):
+        return True
+    if isinstance(noeud, ast.Name) and (noeud.id == "x" or noeud.id in _CONSTANTES):
+        return True
+    if (isinstance(noeud, ast.Call) and isinstance(noeud.func, ast.Name) and noeud.func.id in _FONCTIONS
+            and len(noeud.args) == 1 and not noeud.keywords):
+        return _verifier(noeud.args[0])
+    raise ValueError(f"Élément non autorisé : {ast.dump(noeud)[:60]}")
+
+
+class _EnFlottants(ast.NodeTransformer):
+    """Constantes entières -> flottants : 9**9**9 déborde (inf) au lieu de bloquer le processus."""
+
+    def visit_Constant(self, noeud):
+        return ast.copy_location(ast.Constant(float(noeud.value)), noeud)
+
+
+def normaliser_expression(texte):
+    """Expression en syntaxe Python (str), ou ValueError si elle n'est pas acceptée."""
+    texte = _RE_DEFINITION.sub("", texte.strip())
+    for motif, remplacement in _SUBSTITUTIONS:
+        texte = motif.sub(remplacement, texte)
+    texte = texte.strip()
+    if not texte or len(texte) > MAX_LONGUEUR:
+        raise ValueError("Expression vide ou trop longue")
+    try:
+        arbre = ast.parse(texte, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Expression illisible : {texte}") from e
+    _verifier(arbre)
+    return ast.unparse(arbre)
+
+
+@lru_cache(maxsize=1024)
+def _compiler(expression):
+    arbre = ast.fix_missing_locations(_EnFlottants().visit(ast.parse(expression, mode="eval")))
+    return compile(arbre, "<graphique>", "eval")
+
+
+def _espace_de_noms(np, x):
+    noms = {nom: getattr(np, fonction) for nom, fonction in _FONCTIONS.items()}
+    noms.update({nom: getattr(np, valeur) for nom, valeur in _CONSTANTES.items()})
+    noms["x"] = x
+    return noms
+
+
+def _borne(texte, np):
+    valeur = float(eval(_compiler(normaliser_expression(texte)), {"__builtins__": {}}, _espace_de_noms(np, 0.0)))
+    if not np.isfinite(valeur) or abs(valeur) > 1e6:
+        raise ValueError("Borne invalide")
+    return valeur
+
+
+def analyser_graphique(texte):
+    """
+    "x*exp(-x) ; 1 - x sur [-1 ; 5]" -> (("x * exp(-x)", "1 - x"), (-1.0, 5.0)), ou None
+    si la ligne est inexploitable (expression refusée, intervalle vide...).
+    """
+    moteur = _charger()
+    if moteur is None or not texte:
+        return None
+    np = moteur[1]
+    domaine = DOMAINE_PAR_DEFAUT
+    for motif in _RE_INTERVALLE:
+        m = None
+        for m in motif.finditer(texte):
+            pass  # le dernier intervalle de la ligne
+        if m:
+            try:
+                a, b = _borne(m.group(1), np), _borne(m.group(2), np)
+            except (ValueError, ArithmeticError):
+                return None
+            if not a < b:
+                return None
+            domaine = (a, b)
+            texte = _RE_AVANT_INTERVALLE.sub("", texte[:m.start()]) + texte[m.end():]
+            break
+    try:
+        expressions = tuple(
+            normaliser_expression(morceau) for morceau in texte.split(";") if morceau.strip()
+        )[:MAX_EXPRESSIONS]
+    except ValueError:
+        return None
+    return (expressions, domaine) if expressions else None
+
+
+# --- Évaluation et tracé -------------------------------------------
+
+def evaluer(expression, domaine, nb_points=NB_POINTS):
+    """(x, y) sur une grille régulière ; y vaut NaN là où la fonction n'est pas définie."""
+    np = _charger()[1]
+    x = np.linspace(domaine[0], domaine[1], nb_points)
+    with np.errstate(all="ignore"):
+        try:
+            y = eval(_compiler(expression), {"__builtins__": {}}, _espace_de_noms(np, x))
+        except (ArithmeticError, ValueError):
+            y = np.nan
+        y = np.array(np.broadcast_to(np.asarray(y, dtype=float), x.shape))  # fonctions constantes
+    y[~np.isfinite(y)] = np.nan
+    return x, y
+
+
+def _limites_y(np, courbes):
+    """Fenêtre verticale robuste (centiles 2-98) : une asymptote n'écrase pas le reste de la courbe."""
+    valeurs = np.concatenate([y[np.isfinite(y)] for _, y in courbes])
+    if not len(valeurs):
+        return -1.0, 1.0
+    bas, haut = np.percentile(valeurs, [2, 98])
+    if haut - bas < 1e-9:
+        bas, haut = bas - 1, haut + 1
+    marge = 0.15 * (haut - bas)
+    return bas - marge, haut + marge
+
+
+def _couper_sauts(np, x, y, hauteur):
+    """Insère des NaN aux sauts brutaux (ex. 1/x en 0) pour ne pas relier les deux branches."""
+    with np.errstate(invalid="ignore"):
+        sauts = np.flatnonzero(np.abs(np.diff(y)) > hauteur) + 1
+    if len(sauts):
+        x, y = np.insert(x, sauts, np.nan), np.insert(y, sauts, np.nan)
+    return x, y
+
+
+@lru_cache(maxsize=256)
+def tracer(expressions, domaine, format="svg"):
+    """Image (SVG str, ou PNG bytes) des courbes de `expressions` sur `domaine`, ou None."""
+    moteur = _charger()
+    if moteur is None:
+        return None
+    Figure, np = moteur
+    courbes = [evaluer(expression, domaine) for expression in expressions]
+    if not any(np.isfinite(y).any() for _, y in courbes):
+        return None
+    bas, haut = _limites_y(np, courbes)
+    hauteur = haut - bas
+
+    tampon = io.BytesIO()
+    with _VERROU:
+        figure = Figure(figsize=(5.6, 3.4), dpi=100)
+        axes = figure.add_subplot()
+        for nom, expression, (x, y) in zip(NOMS_COURBES, expressions, courbes):
+            x, y = _couper_sauts(np, x, y, 0.5 * hauteur)
+            y = np.clip(y, bas - hauteur, haut + hauteur)  # hors cadre mais sans valeurs énormes
+            axes.plot(x, y, linewidth=1.8, label=f"{nom}(x) = {expression.replace('**', '^')}")
+        axes.set_xlim(*domaine)
+        axes.set_ylim(bas, haut)
+        axes.axhline(0, color="#333", linewidth=0.8)
+        if domaine[0] < 0 < domaine[1]:
+            axes.axvline(0, color="#333", linewidth=0.8)
+        axes.grid(True, alpha=0.3)
+        axes.legend(loc="best", fontsize=8, frameon=False)
+        figure.tight_layout()
+        # Sans date de rendu : même courbe -> mêmes octets (comme les formules de latex_svg.py)
+        figure.savefig(tampon, format=format, metadata={"Date": None} if format == "svg" else None)
+    if format == "svg":
+        svg = tampon.getvalue().decode("utf-8")
+        # Sans en-tête XML / DOCTYPE ; identifiants propres à la courbe (plusieurs SVG par page)
+        return prefixer_identifiants(svg[svg.find("<svg"):], repr((expressions, domaine)))
+    return tampon.getvalue()
+
+
+def graphique_html(texte, format="svg"):
+    """Fragment HTML (<figure>) pour la ligne GRAPHIQUE d'un exercice, ou None."""
+    analyse = analyser_graphique(texte)
+    if analyse is None:
+        return None
+    image = tracer(*analyse, format=format)
+    if image is None:
+        return None
+    if format != "svg":
+        image = f'<img alt="Courbe" src="data:image/png;base64,{base64.b64encode(image).decode("ascii")}">'
+    return f'<figure class="graphique">{image}</figure>'
+
+
+class Traceur:
+    """
+    Tracés en arrière-plan, partagés entre sessions : demander() dès qu'un exercice est
+    parsé, obtenir() au moment de compléter la fiche (attente bornée).
+    """
+
+    def __init__(self, max_workers=2, taille_max=256):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="graphique")
+        self._verrou = threading.Lock()
+        self._futures = OrderedDict()  # texte GRAPHIQUE -> Future (LRU borné)
+        self.taille_max = taille_max
+
+    def demander(self, texte):
+        if not texte:
+            return None
+        with self._verrou:
+            future = self._futures.get(texte)
+            if future is None:
+                future = self._futures[texte] = self._pool.submit(graphique_html, texte)
+                if len(self._futures) > self.taille_max:
+                    self._futures.popitem(last=False)  # le cache de tracer() garde l'image
+            else:
+                self._futures.move_to_end(texte)
+            return future
+
+    def obtenir(self, exercices, delai=10):
+        """Fragments HTML alignés sur `exercices` (None : pas de graphique, refusé ou trop lent)."""
+        futures = [self.demander(exo.get("graphique")) for exo in exercices]
+        wait([f for f in futures if f is not None], timeout=delai)
+        resultats = []
+        for future in futures:
+            try:
+                resultats.append(future.result(timeout=0) if future is not None else None)
+            except Exception:  # pas fini dans le délai, ou échec du tracé
+                resultats.append(None)
+        return resultats
@@ -0,0 +1,105 @@
+import hashlib
+import html
+import io
+import re
+import threading
+from functools import lru_cache
+
+# PRÉ-RENDU DES FORMULES EN SVG (côté serveur, sans MathJax / CDN)
+# ------------------------------------------------------------------
+# On utilise matplotlib.mathtext (déjà dans requirements.txt) : pas de LaTeX à installer.
+# mathtext ne couvre qu'une partie de LaTeX (pas d'environnements \begin{array}, cases...) :
+# formule_en_svg renvoie None dans ce cas et la formule reste en TeX pour MathJax.
+# Les SVG sont gardés en cache selon le texte de la formule : une formule déjà vue
+# (dans n'importe quelle fiche du processus) n'est rendue qu'une fois.
+
+TAILLE_POLICE = 13  # en points, proche du corps de texte des fiches
+
+# Constructions que mathtext ne sait pas faire : inutile d'essayer
+_RE_NON_SUPPORTE = re.compile(r"\\begin|\\end|\\\\|\\hline|&")
+
+# Bloc <metadata> de matplotlib (date de rendu...) : des octets en plus par formule, et une
+# même formule ne donnerait pas deux fois le même SVG (diffs / caches des fiches hors ligne)
+_RE_METADATA = re.compile(r"\s*<metadata>.*?</metadata>", re.DOTALL)
+
+# matplotlib donne les mêmes identifiants à chaque SVG (figure_1, patch_1, glyphes DejaVuSans-14...) :
+# une fois plusieurs SVG inline dans la même page, ils seraient dupliqués et un <use href="#...">
+# pourrait pointer vers la définition d'une autre formule
+_RE_IDENTIFIANTS = re.compile(r'(\bid="|href="#|url\(#)([^")]+)')
+
+
+def prefixer_identifiants(svg, contenu):
+    """
+    Préfixe les identifiants du SVG (et leurs références) par un hachage court de `contenu`.
+    Déterministe : deux formules différentes n'ont jamais les mêmes identifiants, une même
+    formule garde les mêmes octets (ses définitions, identiques, peuvent se répéter sans risque).
+    """
+    prefixe = "s" + hashlib.blake2s(contenu.encode("utf-8"), digest_size=4).hexdigest() + "-"
+    return _RE_IDENTIFIANTS.sub(lambda m: m.group(1) + prefixe + m.group(2), svg)
+
+# Équivalents acceptés par mathtext
+_SUBSTITUTIONS = [
+    (re.compile(r"\\[dt]frac\b"), r"\\frac"),
+    (re.compile(r"\\displaystyle\b|\\limits\b"), ""),
+    (re.compile(r"\\le\b"), r"\\leq"),
+    (re.compile(r"\\ge\b"), r"\\geq"),
+    (re.compile(r"\\ne\b"), r"\\neq"),
+]
+
+# matplotlib n'est pas thread-safe (Streamlit = un thread par session)
+_VERROU = threading.Lock()
+
+_MATHTEXT = None  # (mathtext, FontProperties) une fois chargé, False si matplotlib absent
+
+
+def _charger_mathtext():
+    """
+    Import paresseux de matplotlib (~0,5 s) : seulement au 1er rendu hors ligne,
+    pas à chaque démarrage / rerun de l'application.
+    Renvoie (mathtext, FontProperties) ou None si matplotlib est absent.
+    """
+    global _MATHTEXT
+    if _MATHTEXT is None:
+        try:
+            from matplotlib import mathtext
+            from matplotlib.font_manager import FontProperties
+            _MATHTEXT = (mathtext, FontProperties)
+        except ImportError:  # rendu serveur indisponible : tout passe par MathJax
+            _MATHTEXT = False
+    return _MATHTEXT or None
+
+
+def _adapter(tex):
+    for motif, remplacement in _SUBSTITUTIONS:
+        tex = motif.sub(remplacement, tex)
+    return tex.strip()
+
+
+@lru_cache(maxsize=8192)
+def formule_en_svg(tex, affichage=False):
+    """
+    SVG inline (str) de la formule `tex` (sans les délimiteurs), ou None si
+    mathtext ne sait pas la rendre. `affichage` = formule centrée ($$...$$).
+    """
+    if not tex.strip() or _RE_NON_SUPPORTE.search(tex):
+        return None
+    moteur = _charger_mathtext()
+    if moteur is None:
+        return None
+    mathtext, FontProperties = moteur
+    taille = TAILLE_POLICE * (1.2 if affichage else 1)
+    tampon = io.BytesIO()
+    try:
+        with _VERROU:
+            profondeur = mathtext.math_to_image(
+                f"${_adapter(tex)}$", tampon, prop=FontProperties(size=taille), dpi=72, format="svg"
+            )
+    except Exception:
+        return None
+
+    svg = tampon.getvalue().decode("utf-8")
+    svg = _RE_METADATA.sub("", svg[svg.find("<svg"):], count=1)  # sans en-tête XML / DOCTYPE ni métadonnées
+    svg = prefixer_identifiants(svg, f"{affichage}:{tex}")
+    # Aligne la ligne de base de la formule sur celle du texte
+    style = "display:block;margin:0.6em auto" if affichage else f"vertical-align:-{profondeur:.2f}pt"
+    return svg.replace("<svg", f'<svg role="img" aria-label="{html.escape(tex)}" style="{style}"', 1)
@@ -0,0 +1,281 @@
+"""
+Mode classe : K versions d'une même fiche (une par élève), archivées dans un ZIP avec un
+corrigé regroupé.
+
+    python lot.py --sujet "Suites numériques" --niveau 1e --type "Exercices classiques" \\
+        --nb 5 --variantes 30 --sortie devoir.zip
+
+Relancer la même commande après un plantage reprend là où le lot s'était arrêté.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from graphiques import graphique_html
+from parseur import parser_format_maison
+from prompts import construire_prompt_variante
+from rendu import generer_html_corrige, generer_html_fiche
+
+# GÉNÉRATION D'UN LOT DE VERSIONS
+# ------------------------------------------------------------------
+# - K appels LLM concurrents, au plus max_workers à la fois (et dans le budget
+#   "generation" de la passerelle, partagé avec les autres sessions)
+# - chaque version terminée est écrite tout de suite sur disque (dossier <zip>.parties) :
+#   la mémoire ne dépend que de max_workers, pas de K
+# - le fichier .json d'une version est écrit en dernier (écriture atomique) : c'est lui qui
+#   marque la version comme terminée. Au redémarrage, les versions présentes sont sautées.
+# - quand tout est là, le ZIP est assemblé en flux depuis le disque (fiches + corrigé
+#   écrit morceau par morceau), puis renommé atomiquement ; le dossier de travail est supprimé.
+# - un seul processus / une seule session à la fois par lot : flock sur <zip>.verrou, gardé
+#   jusqu'à la fin de l'assemblage (ou, après un arrêt, jusqu'à la fin des versions encore en
+#   cours d'écriture) et rendu par le noyau si le processus meurt. Une 2e demande du même lot
+#   lève LotEnCours.
+
+DOSSIER_LOTS = os.getenv("LOTS_PATH", os.path.join(".cache", "lots"))
+MANIFESTE = "lot.json"
+
+
+class LotEnCours(RuntimeError):
+    """Le même lot est déjà en cours de génération (autre session ou autre processus)."""
+
+
+def _nom(indice):
+    return f"version_{indice + 1:02d}"
+
+
+def _ecrire_atomique(chemin, contenu):
+    temporaire = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporaire, "w", encoding="utf-8") as f:
+        f.write(contenu)
+    os.replace(temporaire, chemin)
+
+
+def _verrouiller(chemin_verrou):
+    """
+    Prend le verrou du lot (descripteur à passer à _liberer_apres), ou lève LotEnCours.
+    Verrou du noyau sur le fichier ouvert : libéré automatiquement si le processus meurt
+    (plantage, conteneur redémarré), sans pid à interpréter. Le fichier n'est jamais supprimé :
+    le supprimer pendant qu'un autre l'attend ouvrirait la porte à deux verrous sur deux fichiers.
+    """
+    fd = os.open(chemin_verrou, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        raise LotEnCours(f"Lot déjà en cours de génération ({chemin_verrou}).") from None
+    return fd
+
+
+def _liberer_apres(futures, fd):
+    """Rend le verrou quand toutes les `futures` (versions encore en cours d'écriture) sont finies."""
+    if not futures:
+        os.close(fd)  # fermer le descripteur libère le verrou
+        return
+    restantes = set(futures)
+    verrou = threading.Lock()
+
+    def liberer(future):
+        with verrou:
+            restantes.discard(future)
+            if restantes:
+                return
+        os.close(fd)
+
+    for future in futures:
+        future.add_done_callback(liberer)
+
+
+def _preparer_dossier(dossier, parametres):
+    """Crée le dossier de travail, ou vérifie qu'il correspond bien au même lot (reprise)."""
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, MANIFESTE)
+    if os.path.exists(chemin):
+        with open(chemin, encoding="utf-8") as f:
+            if json.load(f) != parametres:
+                raise ValueError(f"{dossier} contient un autre lot inachevé (paramètres différents).")
+    else:
+        _ecrire_atomique(chemin, json.dumps(parametres, ensure_ascii=False))
+
+
+def generer_version(client, parametres, indice, dossier, modele, tentatives=2):
+    """Génère, parse, rend et écrit une version. Ne renvoie rien de volumineux."""
+    prompt = construire_prompt_variante(
+        parametres["sujet"], parametres["niveau"], parametres["type_exo"], parametres["nb"], parametres["diff"],
+        indice, parametres["nb_variantes"]
+    )
+    for tentative in range(tentatives):
+        response = client.chat.completions.create(
+            model=modele,
+            messages=[
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": "Génère la fiche."}
+            ],
+            temperature=0.8,  # des versions vraiment différentes les unes des autres
+            max_tokens=8000
+        )
+        data = parser_format_maison(response.choices[0].message.content)
+        if data["exercices"]:
+            break
+    else:
+        raise ValueError(f"Version {indice + 1} : réponse sans exercice exploitable")
+
+    titre = f"{data['titre']} — Version {indice + 1}"
+    # Déjà dans un thread du lot : courbes tracées directement (pas d'affichage à ne pas retarder)
+    for exo in data["exercices"]:
+        if exo.get("graphique"):
+            exo["graphique_html"] = graphique_html(exo["graphique"])
+    # memoiser=False : fragments uniques, inutile de remplir le cache de rendu
+    html = generer_html_fiche(titre, data["exercices"], hors_ligne=parametres["hors_ligne"])
+    base = os.path.join(dossier, _nom(indice))
+    _ecrire_atomique(base + ".html", html)
+    _ecrire_atomique(base + ".json", json.dumps(
+        {"titre": titre, "reponses": [exo["reponse"] for exo in data["exercices"]]}, ensure_ascii=False
+    ))
+
+
+def _versions_terminees(dossier, nb_variantes):
+    return {i for i in range(nb_variantes) if os.path.exists(os.path.join(dossier, _nom(i) + ".json"))}
+
+
+def _assembler(dossier, parametres, chemin_zip):
+    nb_variantes = parametres["nb_variantes"]
+
+    def reponses():
+        for i in range(nb_variantes):  # une version en mémoire à la fois
+            with open(os.path.join(dossier, _nom(i) + ".json"), encoding="utf-8") as f:
+                version = json.load(f)
+            yield version["titre"], [{"reponse": r} for r in version["reponses"]]
+
+    temporaire = chemin_zip + ".tmp"
+    with zipfile.ZipFile(temporaire, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for i in range(nb_variantes):
+            archive.write(os.path.join(dossier, _nom(i) + ".html"), _nom(i) + ".html")
+        with archive.open("corrige.html", "w") as corrige:
+            titre = f"Corrigé — {parametres['sujet']} ({nb_variantes} versions)"
+            for morceau in generer_html_corrige(titre, reponses(), hors_ligne=parametres["hors_ligne"]):
+                corrige.write(morceau.encode("utf-8"))
+    os.replace(temporaire, chemin_zip)
+    shutil.rmtree(dossier, ignore_errors=True)
+
+
+def generer_lot(client, sujet, niveau, type_exo, nb, diff, nb_variantes, chemin_zip,
+                max_workers=4, hors_ligne=False, modele="deepseek-chat", progression=None):
+    """
+    Génère `nb_variantes` versions de la fiche dans `chemin_zip` (reprise automatique).
+    progression(terminees, total) est appelée depuis le thread appelant après chaque version.
+
+    Renvoie {"chemin", "generees", "reprises", "echecs"} ; s'il reste des échecs, le ZIP
+    n'est pas assemblé et un nouvel appel ne refait que les versions manquantes.
+    Lève LotEnCours si le même lot est déjà en cours ailleurs.
+    """
+    parametres = {"sujet": sujet, "niveau": niveau, "type_exo": type_exo, "nb": nb, "diff": diff,
+                  "nb_variantes": nb_variantes, "hors_ligne": hors_ligne, "modele": modele}
+    dossier = chemin_zip + ".parties"
+    os.makedirs(os.path.dirname(os.path.abspath(chemin_zip)), exist_ok=True)
+    verrou = _verrouiller(chemin_zip + ".verrou")
+    en_cours = {}
+    try:
+        _preparer_dossier(dossier, parametres)
+
+        deja = _versions_terminees(dossier, nb_variantes)
+        a_faire = [i for i in range(nb_variantes) if i not in deja]
+        echecs = {}
+        if progression:
+            progression(len(deja), nb_variantes)
+
+        # Fenêtre glissante : au plus max_workers versions soumises à la fois (rien ne s'accumule avec K)
+        restantes = iter(a_faire)
+        terminees = len(deja)
+        pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            while True:
+                for i in restantes:
+                    en_cours[pool.submit(generer_version, client, parametres, i, dossier, modele)] = i
+                    if len(en_cours) >= max_workers:
+                        break
+                if not en_cours:
+                    break
+                finies, _ = wait(en_cours, return_when=FIRST_COMPLETED)
+                for future in finies:
+                    indice = en_cours.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        echecs[indice] = e
+                    terminees += 1
+                    if progression:
+                        progression(terminees, nb_variantes)
+        finally:
+            # Arrêt (rerun Streamlit, Ctrl+C) : les versions en cours se terminent en arrière-plan,
+            # les autres ne sont pas lancées ; celles déjà écrites serviront à la reprise.
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if not echecs:
+            _assembler(dossier, parametres, chemin_zip)
+    finally:
+        # Verrou gardé tant qu'une version orpheline peut encore écrire dans le dossier
+        _liberer_apres(list(en_cours), verrou)
+    return {"chemin": chemin_zip, "generees": len(a_faire) - len(echecs), "reprises": len(deja), "echecs": echecs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sujet", required=True)
+    parser.add_argument("--niveau", default="Terminale")
+    parser.add_argument("--type", dest="type_exo", default="Exercices classiques",
+                        choices=["Quiz", "Exercices classiques", "Problème"])
+    parser.add_argument("--nb", type=int, default=5, help="exercices par fiche")
+    parser.add_argument("--difficulte", type=int, default=3)
+    parser.add_argument("--variantes", type=int, default=30, help="nombre de versions (une par élève)")
+    parser.add_argument("--sortie", default="lot.zip")
+    parser.add_argument("--paralleles", type=int, default=4, help="versions générées simultanément")
+    parser.add_argument("--hors-ligne", action="store_true", help="formules pré-rendues en SVG")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from passerelle import Passerelle
+
+    load_dotenv()
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key:
+        print("❌ Clé API manquante (DEEPSEEK_API_KEY)", file=sys.stderr)
+        return 2
+    passerelle = Passerelle(api_key=api_key, base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"))
+
+    def afficher(terminees, total):
+        print(f"\r{terminees}/{total} versions", end="", flush=True)
+
+    try:
+        resultat = generer_lot(
+            passerelle.pour("generation"), args.sujet, args.niveau, args.type_exo, args.nb, args.difficulte,
+            args.variantes, args.sortie, max_workers=args.paralleles, hors_ligne=args.hors_ligne, progression=afficher
+        )
+    except LotEnCours as e:
+        print(f"⏳ {e} Relance la commande quand il sera terminé.", file=sys.stderr)
+        return 1
+    print()
+    for indice, erreur in sorted(resultat["echecs"].items()):
+        print(f"⚠️ version {indice + 1} : {erreur}", file=sys.stderr)
+    if resultat["echecs"]:
+        print("Relance la même commande pour générer les versions manquantes.", file=sys.stderr)
+        return 1
+    print(f"✅ {resultat['chemin']} ({resultat['generees']} générées, {resultat['reprises']} reprises)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import hmac
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+# INSTRUMENTATION : OÙ PASSE LE TEMPS (ET LES TOKENS) ?
+# ------------------------------------------------------------------
+# Une Trace par action utilisateur (question au tuteur, génération de fiche), découpée en
+# spans : construction du prompt, attente API, 1er token, complétion totale, parsing,
+# rendu HTML, affichage du composant... Chaque span porte les compteurs de tokens de
+# response.usage. À la fin de la trace :
+#   - une ligne JSON par span dans un fichier tournant (METRIQUES_PATH)
+#   - agrégats en mémoire (fenêtre glissante) pour les centiles p50 / p95 / p99
+#   - exposition au format texte Prometheus (GET /metrics sur METRIQUES_PORT), sur demande :
+#     pas de port, pas d'exporteur ; non authentifié, il n'écoute que sur 127.0.0.1 sauf si
+#     METRIQUES_HOTE est défini explicitement (ex. 0.0.0.0 derrière un pare-feu)
+# Le tableau de bord Streamlit n'est affiché qu'avec ?admin=<METRIQUES_ADMIN_TOKEN>.
+
+CHEMIN_PAR_DEFAUT = os.getenv("METRIQUES_PATH", os.path.join(".cache", "metriques.jsonl"))
+PORT_PAR_DEFAUT = os.getenv("METRIQUES_PORT", "")  # ex. 9464 ; vide : pas d'exporteur Prometheus
+HOTE_PAR_DEFAUT = os.getenv("METRIQUES_HOTE", "127.0.0.1")
+JETON_ADMIN = os.getenv("METRIQUES_ADMIN_TOKEN", "")
+CHAMPS_USAGE = ("prompt_tokens", "cache_hit_tokens", "completion_tokens")
+
+
+def centile(valeurs_triees, p):
+    """Centile par la méthode du rang le plus proche (liste déjà triée)."""
+    if not valeurs_triees:
+        return float("nan")
+    return valeurs_triees[max(0, math.ceil(p / 100 * len(valeurs_triees)) - 1)]
+
+
+class Registre:
+    """Agrégats du processus + journal JSONL tournant. Thread-safe."""
+
+    def __init__(self, chemin=CHEMIN_PAR_DEFAUT, taille_fichier=5 * 1024 * 1024, nb_fichiers=5, fenetre=2000):
+        self._verrou = threading.Lock()
+        self.fenetre = fenetre
+        self.durees = {}  # nom du span -> deque des dernières durées (s)
+        self.cumuls = {}  # nom du span -> [nombre, somme des durées]
+        self.observations = {}  # ex. "tuteur.tokens_par_seconde" -> deque
+        self.tokens = dict.fromkeys(CHAMPS_USAGE, 0)
+        self.traces = {}  # nom de trace -> {"ok": n, "erreur": n}
+        self._journal = None
+        if chemin:
+            os.makedirs(os.path.dirname(chemin) or ".", exist_ok=True)
+            self._journal = logging.getLogger(f"metriques.{uuid.uuid4().hex}")
+            self._journal.propagate = False
+            self._journal.setLevel(logging.INFO)
+            gestionnaire = RotatingFileHandler(chemin, maxBytes=taille_fichier, backupCount=nb_fichiers,
+                                               encoding="utf-8")
+            gestionnaire.setFormatter(logging.Formatter("%(message)s"))
+            self._journal.addHandler(gestionnaire)
+
+    def enregistrer(self, trace):
+        lignes = []
+        with self._verrou:
+            compte = self.traces.setdefault(trace.nom, {"ok": 0, "erreur": 0})
+            compte[trace.statut] += 1
+            for champ in CHAMPS_USAGE:
+                self.tokens[champ] += trace.usage.get(champ, 0)
+            for nom, debut, duree, attributs in trace.spans:
+                self.durees.setdefault(nom, deque(maxlen=self.fenetre)).append(duree)
+                cumul = self.cumuls.setdefault(nom, [0, 0.0])
+                cumul[0] += 1
+                cumul[1] += duree
+                lignes.append({
+                    "trace": trace.identifiant, "nom": nom, "debut": round(debut, 6),
+                    "duree_ms": round(duree * 1000, 3), "statut": trace.statut,
+                    **trace.attributs, **attributs, **trace.usage,
+                })
+            for nom, valeur in trace.observations:
+                self.observations.setdefault(nom, deque(maxlen=self.fenetre)).append(valeur)
+        if self._journal:
+            for ligne in lignes:
+                self._journal.info(json.dumps(ligne, ensure_ascii=False, default=str))
+
+    def tableau(self):
+        """Une ligne par span / observation : n, moyenne, p50, p95, p99 (fenêtre glissante)."""
+        with self._verrou:
+            series = [(nom, sorted(v), 1000, "ms") for nom, v in self.durees.items()]
+            series += [(nom, sorted(v), 1, "") for nom, v in self.observations.items()]
+        return [
+            {"mesure": nom, "unité": unite, "n": len(v),
+             "moyenne": round(sum(v) / len(v) * facteur, 1),
+             "p50": round(centile(v, 50) * facteur, 1), "p95": round(centile(v, 95) * facteur, 1),
+             "p99": round(centile(v, 99) * facteur, 1)}
+            for nom, v, facteur, unite in sorted(series) if v
+        ]
+
+    def prometheus(self):
+        """Format texte d'exposition Prometheus (résumés avec quantiles)."""
+        def etiquette(valeur):
+            return valeur.replace("\\", "\\\\").replace('"', '\\"')
+
+        with self._verrou:
+            durees = {nom: sorted(v) for nom, v in self.durees.items()}
+            cumuls = {nom: list(c) for nom, c in self.cumuls.items()}
+            observations = {nom: sorted(v) for nom, v in self.observations.items()}
+            tokens = dict(self.tokens)
+            traces = {nom: dict(c) for nom, c in self.traces.items()}
+
+        lignes = ["# HELP maths_tuteur_span_secondes Durée des étapes (fenêtre glissante pour les quantiles)",
+                  "# TYPE maths_tuteur_span_secondes summary"]
+        for nom in sorted(durees):
+            for q in (0.5, 0.95, 0.99):
+                lignes.append(f'maths_tuteur_span_secondes{{span="{etiquette(nom)}",quantile="{q}"}} '
+                              f'{centile(durees[nom], q * 100):.6f}')
+            lignes.append(f'maths_tuteur_span_secondes_count{{span="{etiquette(nom)}"}} {cumuls[nom][0]}')
+            lignes.append(f'maths_tuteur_span_secondes_sum{{span="{etiquette(nom)}"}} {cumuls[nom][1]:.6f}')
+        lignes += ["# HELP maths_tuteur_observation Autres mesures (tokens/s...)",
+                   "# TYPE maths_tuteur_observation summary"]
+        for nom in sorted(observations):
+            for q in (0.5, 0.95, 0.99):
+                lignes.append(f'maths_tuteur_observation{{nom="{etiquette(nom)}",quantile="{q}"}} '
+                              f'{centile(observations[nom], q * 100):.6f}')
+        lignes += ["# HELP maths_tuteur_tokens_total Tokens consommés (response.usage)",
+                   "# TYPE maths_tuteur_tokens_total counter"]
+        lignes += [f'maths_tuteur_tokens_total{{type="{champ}"}} {n}' for champ, n in tokens.items()]
+        lignes += ["# HELP maths_tuteur_traces_total Actions utilisateur terminées",
+                   "# TYPE maths_tuteur_traces_total counter"]
+        for nom in sorted(traces):
+            for statut, n in traces[nom].items():
+                lignes.append(f'maths_tuteur_traces_total{{trace="{etiquette(nom)}",statut="{statut}"}} {n}')
+        return "\n".join(lignes) + "\n"
+
+
+class Trace:
+    """
+    Mesures d'une action utilisateur. Usage :
+
+        with Trace(registre, "fiche", type_exo=...) as trace:
+            with trace.span("prompt"):
+                ...
+            trace.ajouter_span("ttft", duree)   # durée mesurée ailleurs
+            trace.noter_usage(usage)            # dict de contexte.lire_usage
+    Les spans sont enregistrés à la sortie du `with` (statut "erreur" si exception).
+    """
+
+    def __init__(self, registre, nom, **attributs):
+        self.registre = registre
+        self.nom = nom
+        self.identifiant = uuid.uuid4().hex[:16]
+        self.attributs = {"trace_nom": nom, **attributs}
+        self.usage = {}
+        self.spans = []  # (nom complet, début epoch, durée s, attributs)
+        self.observations = []
+        self.statut = "ok"
+
+    @contextmanager
+    def span(self, nom, **attributs):
+        debut, t0 = time.time(), time.perf_counter()
+        try:
+            yield attributs  # le bloc peut compléter les attributs du span
+        finally:
+            self.spans.append((f"{self.nom}.{nom}", debut, time.perf_counter() - t0, attributs))
+
+    def ajouter_span(self, nom, duree, **attributs):
+        self.spans.append((f"{self.nom}.{nom}", time.time() - duree, duree, attributs))
+
+    def observer(self, nom, valeur):
+        self.observations.append((f"{self.nom}.{nom}", valeur))
+
+    def noter_usage(self, usage):
+        for champ in CHAMPS_USAGE:
+            self.usage[champ] = self.usage.get(champ, 0) + (usage.get(champ) or 0)
+
+    def echouer(self, exc):
+        """À appeler quand l'exception est interceptée dans le `with` (affichée à l'utilisateur)."""
+        self.statut = "erreur"
+        self.attributs["erreur"] = type(exc).__name__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_exc, exc, tb):
+        if exc is not None:
+            self.echouer(exc)
+        if self.registre is not None:
+            self.registre.enregistrer(self)
+
+
+def noter_completion(trace, attente_api, ttft, duree, usage):
+    """
+    Spans d'un appel LLM streamé : attente de la 1re réponse, 1er token, durée totale,
+    + débit (tokens/s après le 1er token) et tokens de response.usage (dict lire_usage).
+    """
+    if attente_api is not None:
+        trace.ajouter_span("api.attente", attente_api)
+    if ttft is not None:
+        trace.ajouter_span("api.ttft", ttft)
+    trace.ajouter_span("api.total", duree)
+    if usage:
+        trace.noter_usage(usage)
+        if ttft is not None and duree > ttft and usage.get("completion_tokens"):
+            trace.observer("tokens_par_seconde", usage["completion_tokens"] / (duree - ttft))
+
+
+def demarrer_exporteur(registre, port=PORT_PAR_DEFAUT, hote=HOTE_PAR_DEFAUT):
+    """Sert GET /metrics (format Prometheus) dans un thread. Renvoie le serveur, ou None."""
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            corps = registre.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corps)))
+            self.end_headers()
+            self.wfile.write(corps)
+
+    try:
+        serveur = ThreadingHTTPServer((hote, int(port)), Handler)
+    except OSError:  # port occupé (plusieurs processus) : le journal JSONL reste disponible
+        return None
+    serveur.daemon_threads = True
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    return serveur
+
+
+def est_admin(jeton):
+    """Accès au tableau de bord : jeton fourni == METRIQUES_ADMIN_TOKEN (désactivé si non défini)."""
+    # En octets : compare_digest refuse les str non ASCII (?admin=é ferait planter la page)
+    return bool(JETON_ADMIN) and bool(jeton) and hmac.compare_digest(
+        str(jeton).encode("utf-8"), JETON_ADMIN.encode("utf-8")
+    )
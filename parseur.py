@@ -0,0 +1,202 @@
+import re
+
+# PARSEUR DU FORMAT MAISON (TITRE_FICHE / ===NOUVEL_EXERCICE=== / QUESTION / ...)
+# ------------------------------------------------------------------
+
+MARQUEUR_EXERCICE = "===NOUVEL_EXERCICE==="
+TITRE_PAR_DEFAUT = "Fiche de Mathématiques"
+CLES = ["TITRE_FICHE", "QUESTION", "REPONSE", "DETAIL", "DIFFICULTE"]
+
+
+# Motifs compilés une seule fois (à l'import).
+# Un seul passage pour toutes les clés : "**QUESTION** :", "#question:" ... -> "QUESTION:"
+_CLES_ALTERNATIVE = "|".join(CLES)
+# Le lookahead sur les premiers caractères possibles évite de lancer tout le motif à chaque position
+_PREMIERS = "#*" + "".join(sorted({k[0] for k in CLES}))
+_RE_CLES_SALES = re.compile(
+    fr"(?=[{_PREMIERS}])(?:#?\**({_CLES_ALTERNATIVE})\**\s*:|#({_CLES_ALTERNATIVE}))", re.IGNORECASE
+)
+# Après nettoyage, chaque section commence par "CLE:" en majuscules exactement
+_RE_SECTIONS = re.compile(r"(QUESTION|REPONSE|DETAIL|DIFFICULTE):")
+_RE_CHIFFRE = re.compile(r"\s*(\d)")
+# Champ optionnel GRAPHIQUE (courbes à tracer, voir graphiques.py) : en majuscules et en début
+# de ligne uniquement, sinon "lecture graphique :" dans un énoncé serait pris pour le champ.
+_RE_GRAPHIQUE = re.compile(r"^[ \t#*]*GRAPHIQUE[ \t*]*:[ \t]*(.*)$", re.MULTILINE)
+
+
+def _canonique(cle):
+    # .upper() suffit presque toujours ; les équivalences Unicode de IGNORECASE (ex: "ſ") sont rares
+    majuscule = cle.upper()
+    if majuscule in CLES:
+        return majuscule
+    return next(k for k in CLES if re.fullmatch(k, cle, re.IGNORECASE))
+
+
+def _remplacer_cle(m):
+    if m.group(1) is not None:
+        return _canonique(m.group(1)) + ":"
+    return _canonique(m.group(2))
+
+
+def _nettoyer(texte):
+    """
+    Nettoyage du texte pour faciliter la lecture.
+    On enlève les balises code, et on supprime les étoiles ** autour des mots clés
+    Ex: transforme "**TITRE_FICHE**:" en "TITRE_FICHE:"
+    """
+    texte_clean = texte.replace("```text", "").replace("```", "")
+    return _RE_CLES_SALES.sub(_remplacer_cle, texte_clean)
+
+
+def _chercher_titre(texte_clean):
+    """
+    Titre de la fiche dans un bloc, ou None. Le texte est déjà découpé aux marqueurs : si
+    "===NOUVEL_EXERCICE===" suit TITRE_FICHE sur la même ligne, le titre s'arrête au marqueur
+    (l'ancien parseur, qui cherchait dans tout le texte, gardait le marqueur et la suite de la
+    ligne dans le titre). C'est la seule différence de résultat avec l'ancien parseur.
+    """
+    pos = texte_clean.find("TITRE_FICHE:")
+    if pos == -1:
+        return None
+    # Équivalent de r"TITRE_FICHE\s*:\s*(.*)" : on saute les blancs puis jusqu'à la fin de ligne
+    reste = texte_clean[pos + len("TITRE_FICHE:"):].lstrip()
+    return reste.split("\n", 1)[0].strip()
+
+
+def _parser_bloc(bloc):
+    """
+    Transforme un bloc (déjà nettoyé) en dict exercice, ou None s'il n'en contient pas.
+    Un seul parcours des marqueurs de section ; pour chaque champ on prend
+    la 1re section de ce type et le 1er marqueur suivant attendu
+    (QUESTION -> REPONSE -> DETAIL -> DIFFICULTE), comme les anciens re.search paresseux.
+    """
+    if not bloc.strip() or "TITRE_FICHE" in bloc:
+        return None
+
+    exo = {
+        "question": "",
+        "reponse": "",
+        "correction_detaillee": "",
+        "difficulte": 3
+    }
+
+    # debuts[cle] = (début, fin) de la 1re occurrence ; suivants[cle] = début du 1er marqueur
+    # "cle suivante" situé après cette 1re occurrence
+    debuts = {}
+    suivants = {}
+    attendu = {"REPONSE": "QUESTION", "DETAIL": "REPONSE", "DIFFICULTE": "DETAIL"}
+    difficulte = None
+    for m in _RE_SECTIONS.finditer(bloc):
+        cle = m.group(1)
+        precedent = attendu.get(cle)
+        if precedent in debuts and precedent not in suivants:
+            suivants[precedent] = m.start()
+        if cle not in debuts:
+            debuts[cle] = (m.start(), m.end())
+        if cle == "DIFFICULTE" and difficulte is None:
+            chiffre = _RE_CHIFFRE.match(bloc, m.end())
+            if chiffre:
+                difficulte = int(chiffre.group(1))
+
+    graphique = _RE_GRAPHIQUE.search(bloc) if "GRAPHIQUE" in bloc else None
+    if graphique:
+        # La ligne GRAPHIQUE (et son saut de ligne) ne fait partie d'aucune autre section
+        ligne_debut, ligne_fin = graphique.start(), graphique.end()
+        if bloc.startswith("\n", ligne_fin):
+            ligne_fin += 1
+
+    def extraire(debut, fin):
+        fin = len(bloc) if fin is None else fin
+        if graphique and debut <= ligne_debut < fin:
+            return (bloc[debut:ligne_debut] + bloc[ligne_fin:fin]).strip()
+        return bloc[debut:fin].strip()
+
+    if "QUESTION" in suivants:
+        exo["question"] = extraire(debuts["QUESTION"][1], suivants["QUESTION"])
+    if "REPONSE" in suivants:
+        exo["reponse"] = extraire(debuts["REPONSE"][1], suivants["REPONSE"])
+    # Fallback détail (si l'IA oublie DIFFICULTE à la fin) : jusqu'à la fin du bloc
+    if "DETAIL" in debuts:
+        exo["correction_detaillee"] = extraire(debuts["DETAIL"][1], suivants.get("DETAIL"))
+    if difficulte is not None:
+        exo["difficulte"] = difficulte
+    if graphique and graphique.group(1).strip():
+        exo["graphique"] = graphique.group(1).strip()
+
+    if exo["question"]:
+        return exo
+    return None
+
+
+class ParseurFlux:
+    """
+    Parseur incrémental : on lui donne les morceaux du stream au fur et à mesure,
+    il renvoie chaque exercice dès que son bloc est terminé (marqueur suivant reçu).
+    Le dernier bloc n'est complet qu'à la fin du stream -> terminer().
+
+    Usage :
+        parseur = ParseurFlux()
+        for morceau in stream:
+            for exo in parseur.ajouter(morceau): afficher(exo)
+        for exo in parseur.terminer(): afficher(exo)
+        data = parseur.resultat()
+    """
+
+    def __init__(self):
+        self.titre = TITRE_PAR_DEFAUT
+        self.exercices = []
+        self._titre_trouve = False
+        self._tampon = ""
+        self._debut_recherche = 0
+
+    def _traiter_bloc(self, bloc_brut):
+        bloc = _nettoyer(bloc_brut)
+        if not self._titre_trouve:
+            titre = _chercher_titre(bloc)
+            if titre is not None:
+                self.titre = titre
+                self._titre_trouve = True
+        exo = _parser_bloc(bloc)
+        if exo is not None:
+            self.exercices.append(exo)
+        return exo
+
+    def ajouter(self, morceau):
+        """Ajoute un morceau de texte. Renvoie la liste des exercices complétés par ce morceau."""
+        nouveaux = []
+        tampon = self._tampon + morceau
+        debut = 0  # on avance dans le tampon sans le recopier à chaque bloc
+        pos = tampon.find(MARQUEUR_EXERCICE, self._debut_recherche)
+        while pos != -1:
+            exo = self._traiter_bloc(tampon[debut:pos])
+            if exo is not None:
+                nouveaux.append(exo)
+            debut = pos + len(MARQUEUR_EXERCICE)
+            pos = tampon.find(MARQUEUR_EXERCICE, debut)
+        self._tampon = tampon[debut:]
+        # Le marqueur peut être coupé entre deux morceaux : on ne rescannera que la fin
+        self._debut_recherche = max(0, len(self._tampon) - len(MARQUEUR_EXERCICE) + 1)
+        return nouveaux
+
+    def terminer(self):
+        """Fin du stream : traite le dernier bloc. Renvoie la liste des exercices restants."""
+        bloc, self._tampon = self._tampon, ""
+        self._debut_recherche = 0
+        exo = self._traiter_bloc(bloc)
+        return [exo] if exo is not None else []
+
+    def resultat(self):
+        return {"titre": self.titre, "exercices": list(self.exercices)}
+
+
+def parser_format_maison(texte_brut):
+    """
+    Découpe le texte de l'IA en exercices structurés.
+    Accepte les variantes de formatage (gras, italique, etc.)
+    Version "tout d'un coup" : même résultat que ParseurFlux alimenté morceau par morceau.
+    Titre : arrêté au marqueur d'exercice s'il est sur la même ligne (voir _chercher_titre).
+    """
+    parseur = ParseurFlux()
+    parseur.ajouter(texte_brut)
+    parseur.terminer()
+    return parseur.resultat()
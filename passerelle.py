@@ -0,0 +1,187 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import httpx
+from openai import APIConnectionError, APITimeoutError, InternalServerError, OpenAI, RateLimitError
+
+# PASSERELLE LLM PARTAGÉE (un objet par processus)
+# ------------------------------------------------------------------
+# Quand 30 élèves cliquent en même temps : rafales de 429 et requêtes bloquées qui
+# immobilisent les threads Streamlit. La passerelle regroupe :
+#   - un client HTTP keep-alive partagé (pool de connexions borné, timeouts)
+#   - un limiteur par budget ("chat" / "generation") : au plus N appels simultanés,
+#     les autres attendent leur tour (file) au lieu d'inonder l'API
+#   - des relances avec backoff exponentiel + jitter, en respectant Retry-After
+#   - des métriques : profondeur de file, temps d'attente, relances, erreurs
+#
+# passerelle.pour("chat") renvoie un objet qui s'utilise comme le client OpenAI
+# (client.chat.completions.create(...)) : le reste du code ne change pas.
+
+BUDGETS_PAR_DEFAUT = {
+    "chat": int(os.getenv("LLM_MAX_CHAT", "16")),
+    "generation": int(os.getenv("LLM_MAX_GENERATION", "6")),
+}
+ERREURS_A_RELANCER = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+class FileSaturee(Exception):
+    """Trop d'attente pour obtenir une place dans le budget."""
+
+
+class Limiteur:
+    """Sémaphore + métriques (file d'attente, temps d'attente) pour un budget."""
+
+    def __init__(self, nom, max_simultanes, attente_max=90):
+        self.nom = nom
+        self.max_simultanes = max_simultanes
+        self.attente_max = attente_max
+        self._semaphore = threading.BoundedSemaphore(max_simultanes)
+        self._verrou = threading.Lock()
+        self.en_attente = 0
+        self.en_cours = 0
+        self.total = 0
+        self.relances = 0
+        self.erreurs = 0
+        self.refus = 0
+        self.attentes = deque(maxlen=1000)  # secondes, dernières requêtes
+
+    @contextmanager
+    def place(self):
+        t0 = time.perf_counter()
+        with self._verrou:
+            self.en_attente += 1
+        obtenu = self._semaphore.acquire(timeout=self.attente_max)
+        with self._verrou:
+            self.en_attente -= 1
+            if not obtenu:
+                self.refus += 1
+            else:
+                self.en_cours += 1
+                self.total += 1
+                self.attentes.append(time.perf_counter() - t0)
+        if not obtenu:
+            raise FileSaturee(f"Trop de demandes en cours ({self.nom}), réessaie dans un instant.")
+        try:
+            yield
+        finally:
+            with self._verrou:
+                self.en_cours -= 1
+            self._semaphore.release()
+
+    def compter(self, champ):
+        with self._verrou:
+            setattr(self, champ, getattr(self, champ) + 1)
+
+    def metriques(self):
+        with self._verrou:
+            attentes = sorted(self.attentes)
+        def centile(p):
+            return attentes[min(len(attentes) - 1, int(p / 100 * len(attentes)))] if attentes else 0.0
+        return {
+            "max_simultanes": self.max_simultanes,
+            "en_attente": self.en_attente,
+            "en_cours": self.en_cours,
+            "total": self.total,
+            "relances": self.relances,
+            "erreurs": self.erreurs,
+            "refus": self.refus,
+            "attente_p50": centile(50),
+            "attente_p95": centile(95),
+        }
+
+
+def _retry_after(erreur):
+    """Délai demandé par le serveur (en-têtes retry-after-ms / retry-after), ou None."""
+    reponse = getattr(erreur, "response", None)
+    if reponse is None:
+        return None
+    entetes = reponse.headers
+    try:
+        if "retry-after-ms" in entetes:
+            return float(entetes["retry-after-ms"]) / 1000
+        if "retry-after" in entetes:
+            return float(entetes["retry-after"])
+    except ValueError:  # format date HTTP : on se contente du backoff
+        pass
+    return None
+
+
+class Passerelle:
+    def __init__(self, api_key, base_url, budgets=None, tentatives=4, backoff_base=0.5, backoff_max=20.0,
+                 timeout=httpx.Timeout(120.0, connect=5.0), max_connexions=64):
+        self.tentatives = tentatives
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.http = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connexions, max_keepalive_connections=max_connexions,
+                                keepalive_expiry=60),
+        )
+        # max_retries=0 : c'est la passerelle qui relance (avec le limiteur)
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=self.http, max_retries=0)
+        self.limiteurs = {
+            nom: Limiteur(nom, n) for nom, n in (budgets or BUDGETS_PAR_DEFAUT).items()
+        }
+
+    def _pause(self, tentative, erreur):
+        delai = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** tentative))  # "full jitter"
+        demande = _retry_after(erreur)
+        if demande is not None:
+            delai = max(delai, min(demande, self.backoff_max))
+        time.sleep(delai)
+
+    def completion(self, budget, **kwargs):
+        """chat.completions.create non streamé, dans le budget donné, avec relances."""
+        limiteur = self.limiteurs[budget]
+        for tentative in range(self.tentatives):
+            try:
+                with limiteur.place():
+                    return self.client.chat.completions.create(**kwargs)
+            except ERREURS_A_RELANCER as e:
+                if tentative == self.tentatives - 1:
+                    limiteur.compter("erreurs")
+                    raise
+                limiteur.compter("relances")
+                # On attend HORS du limiteur : la place est rendue pendant le backoff
+                self._pause(tentative, e)
+
+    def flux(self, budget, **kwargs):
+        """
+        Version streaming (générateur de chunks). La place est gardée jusqu'à la fin
+        du stream (ou son abandon) ; on ne relance que si rien n'a encore été reçu.
+        """
+        limiteur = self.limiteurs[budget]
+        for tentative in range(self.tentatives):
+            recu = False
+            try:
+                with limiteur.place():
+                    stream = self.client.chat.completions.create(**kwargs)
+                    try:
+                        for chunk in stream:
+                            recu = True
+                            yield chunk
+                    finally:
+                        stream.close()
+                return
+            except ERREURS_A_RELANCER as e:
+                if recu or tentative == self.tentatives - 1:
+                    limiteur.compter("erreurs")
+                    raise
+                limiteur.compter("relances")
+                self._pause(tentative, e)
+
+    def pour(self, budget):
+        """Objet compatible client OpenAI (chat.completions.create) limité au budget donné."""
+        def create(**kwargs):
+            if kwargs.get("stream"):
+                return self.flux(budget, **kwargs)
+            return self.completion(budget, **kwargs)
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def metriques(self):
+        return {nom: limiteur.metriques() for nom, limiteur in self.limiteurs.items()}
@@ -0,0 +1,261 @@
+import html
+import re
+from functools import lru_cache
+
+from latex_svg import formule_en_svg
+
+# MOTEUR DE RENDU HTML DES FICHES
+# ------------------------------------------------------------------
+# - la page (CSS + MathJax) est découpée UNE fois à l'import, pas reconstruite à chaque appel
+# - les fragments d'exercices sont assemblés en une passe ("".join, pas de += dans la boucle)
+# - le texte du modèle est échappé (un "<" isolé ne casse plus la mise en page)
+# - mode memoiser=True : chaque exercice rendu est gardé en cache selon son contenu ;
+#   re-rendre une fiche après avoir modifié un exercice ne refait que celui-là
+# - mode hors_ligne=True : formules pré-rendues en SVG côté serveur (latex_svg.py) ; ces
+#   fragments (plusieurs ko de SVG par formule) ne passent pas par le cache de fragments,
+#   chaque formule étant déjà en cache dans latex_svg
+
+GABARIT_PAGE = """
+<!DOCTYPE html>
+<html lang="fr">
+<head>
+    <meta charset="UTF-8">
+    <title>@@TITRE@@</title>
+@@MATHJAX@@    <style>
+        body { font-family: 'Helvetica', 'Arial', sans-serif; background: #f4f6f9; padding: 40px; line-height: 1.6; color: #333; }
+        .container { max-width: 900px; margin: 0 auto; background: white; padding: 60px; border-radius: 2px; box-shadow: 0 4px 10px rgba(0,0,0,0.1); }
+        h1 { text-align: center; color: #000; border-bottom: 2px solid #000; padding-bottom: 20px; margin-bottom: 50px; text-transform: uppercase; letter-spacing: 2px; }
+        .exercice { margin-bottom: 40px; page-break-inside: avoid; border-bottom: 1px dashed #ccc; padding-bottom: 30px; }
+        .exercice:last-child { border-bottom: none; }
+        .exercice-header { display: flex; justify-content: space-between; margin-bottom: 15px; align-items: baseline; }
+        .exercice-header h2 { color: #2c3e50; font-size: 1.4em; margin: 0; text-decoration: underline; }
+        .question { font-size: 1.15em; margin-bottom: 20px; text-align: justify; }
+        .correction { margin-top: 20px; background: #f8f9fa; padding: 15px; border-left: 3px solid #2980b9; }
+        .reponse { font-weight: bold; margin-bottom: 10px; color: #27ae60; }
+        .detail { font-size: 0.95em; color: #555; }
+        .verif { font-size: 0.75em; padding: 2px 8px; border-radius: 10px; margin-right: 8px; vertical-align: middle; }
+        .verif-ok { background: #e8f6ee; color: #27ae60; }
+        .verif-ko { background: #fdecea; color: #c0392b; }
+        .verif-delai { background: #f4f4f4; color: #888; }
+        .graphique { margin: 0 auto 20px; text-align: center; }
+        .graphique svg, .graphique img { max-width: 100%; height: auto; }
+        
+        .btn-print { 
+            display: block; width: 100%; padding: 20px; 
+            background: #4b6cb7; color: white; text-align: center; 
+            font-size: 20px; font-weight: bold; border-radius: 8px; 
+            cursor: pointer; margin-bottom: 40px; text-decoration: none;
+            box-shadow: 0 4px 6px rgba(0,0,0,0.2);
+        }
+        .btn-print:hover { background: #3b5998; }
+
+        @media print {
+            body { background: white; padding: 0; margin: 0; }
+            .container { box-shadow: none; border: none; width: 100%; max-width: 100%; margin: 0; padding: 40px; }
+            .no-print { display: none !important; }
+            details { display: block !important; }
+            summary { display: none !important; }
+            .correction { display: block !important; border: 1px solid #eee; }
+            a { text-decoration: none; color: black; }
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <a href="#" class="no-print btn-print" onclick="window.print()">📥 Télécharger / Imprimer en PDF</a>
+        <h1>📚 @@TITRE@@</h1>
+        @@EXERCICES@@
+        <div style="text-align: center; margin-top: 50px; color: #aaa; font-size: 0.8em; border-top: 1px solid #eee; padding-top: 20px;">
+            Généré par Maths Tutor IA (DeepSeek Power)
+        </div>
+    </div>
+</body>
+</html>
+    """
+
+SCRIPTS_MATHJAX = """    <script>
+    window.MathJax = {
+        tex: {
+            inlineMath: [['$', '$'], ['\\\\(', '\\\\)']], 
+            displayMath: [['$$', '$$'], ['\\\\[', '\\\\]']],
+            processEscapes: true,
+            packages: {'[+]': ['amsmath', 'amssymb', 'noerrors', 'noundefined']}
+        },
+        svg: { fontCache: 'global' }
+    };
+    </script>
+    <script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js" async></script>
+"""
+
+# Découpage à l'import : [texte, "TITRE", texte, "MATHJAX", texte, "TITRE", texte, "EXERCICES", texte]
+_MORCEAUX_PAGE = re.split(r"@@(TITRE|MATHJAX|EXERCICES)@@", GABARIT_PAGE)
+
+# Formules : $$...$$, $...$, \\[...\\], \\(...\\)  (un \\$ échappé n'est pas un délimiteur)
+_RE_MATHS = re.compile(
+    r"(?<!\\)\$\$.+?(?<!\\)\$\$|(?<!\\)\$.+?(?<!\\)\$|\\\[.+?\\\]|\\\(.+?\\\)",
+    re.DOTALL
+)
+
+
+def _echapper_maths(formule):
+    # MathJax lit le texte du DOM (entités décodées) : le TeX qu'il reçoit reste identique
+    return formule.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _formule_svg(formule):
+    """SVG de la formule (avec ses délimiteurs) ou None si le rendu serveur n'en est pas capable."""
+    if formule.startswith("$$"):
+        tex, affichage = formule[2:-2], True
+    elif formule.startswith("$"):
+        tex, affichage = formule[1:-1], False
+    else:  # \[...\] ou \(...\)
+        tex, affichage = formule[2:-2], formule.startswith("\\[")
+    return formule_en_svg(tex, affichage)
+
+
+def _formater(texte, sauts_de_ligne=True, hors_ligne=False):
+    """Renvoie (html, nombre de formules laissées à MathJax)."""
+    morceaux = []
+    pour_mathjax = 0
+    debut = 0
+    for m in _RE_MATHS.finditer(texte):
+        morceaux.append(html.escape(texte[debut:m.start()], quote=False))
+        svg = _formule_svg(m.group(0)) if hors_ligne else None
+        if svg is None:
+            svg = _echapper_maths(m.group(0))
+            pour_mathjax += 1
+        morceaux.append(svg)
+        debut = m.end()
+    morceaux.append(html.escape(texte[debut:], quote=False))
+    if sauts_de_ligne:
+        # Les retours à la ligne dans une formule restent des espaces pour MathJax
+        return "".join(
+            m.replace("\n", "<br>") if i % 2 == 0 else m for i, m in enumerate(morceaux)
+        ), pour_mathjax
+    return "".join(morceaux), pour_mathjax
+
+
+def formater_texte(texte, sauts_de_ligne=True, hors_ligne=False):
+    """
+    Échappe le texte du modèle pour le HTML, sans toucher aux formules :
+    hors maths -> html.escape (+ retours à la ligne en <br>), dans les maths -> TeX conservé.
+    hors_ligne=True : les formules sont pré-rendues en SVG quand c'est possible (latex_svg.py).
+    """
+    return _formater(texte, sauts_de_ligne, hors_ligne)[0]
+
+
+# Badge de vérification SymPy (voir verification.py) : statut -> (classe CSS, texte)
+BADGES_VERIFICATION = {
+    "verifie": ("verif-ok", "✅ vérifié"),
+    "non_verifie": ("verif-ko", "⚠️ non vérifié"),
+    "delai": ("verif-delai", "⏳ délai dépassé"),
+}
+
+
+# Le graphique (SVG de graphiques.py, plusieurs dizaines de ko) est inséré après coup :
+# il ne doit pas grossir chaque entrée du cache de fragments ci-dessous
+_EMPLACEMENT_GRAPHIQUE = "<!--graphique-->"
+
+
+def _corps_exercice(question, reponse, detail, difficulte, hors_ligne=False, verification=None):
+    """
+    Fragment HTML d'un exercice, sans son numéro (qui dépend de la position).
+    Renvoie (fragment, nombre de formules laissées à MathJax).
+    """
+    q, nq = _formater(question, hors_ligne=hors_ligne)
+    r, nr = _formater(reponse, sauts_de_ligne=False, hors_ligne=hors_ligne)
+    d, nd = _formater(detail, hors_ligne=hors_ligne)
+    badge = ""
+    if verification in BADGES_VERIFICATION:
+        classe, texte = BADGES_VERIFICATION[verification]
+        badge = f'<span class="verif {classe}">{texte}</span> '
+    return f"""</h2>
+                <span class="difficulte">{badge}{'⭐' * difficulte}</span>
+            </div>
+            
+            <div class="question">
+                {q}
+            </div>
+            {_EMPLACEMENT_GRAPHIQUE}
+            <details class="correction">
+                <summary>📖 Voir la correction détaillée</summary>
+                <div class="reponse"><strong>Réponse :</strong> {r}</div>
+                <div class="detail">
+                    <strong>Explications :</strong><br>
+                    {d}
+                </div>
+            </details>
+        </div>
+        """, nq + nr + nd
+
+
+# Cache des fragments, indexé par le contenu de l'exercice (hash des chaînes).
+# Fragments MathJax seulement (quelques ko) : mémoire bornée à quelques Mo.
+_corps_exercice_memoise = lru_cache(maxsize=1024)(_corps_exercice)
+
+_DEBUT_EXERCICE = """
+        <div class="exercice">
+            <div class="exercice-header">
+                <h2>📝 Exercice """
+
+
+def generer_html_fiche(titre, exercices, memoiser=False, hors_ligne=False):
+    """
+    Page HTML complète de la fiche.
+    - memoiser : réutilise les fragments d'exercices déjà rendus (même contenu) ;
+      sans effet en mode hors ligne
+    - hors_ligne : formules pré-rendues en SVG ; MathJax (CDN) n'est chargé que
+      si certaines formules n'ont pas pu être rendues côté serveur
+    Un exercice peut porter une clé "verification" (statut SymPy) affichée en badge,
+    et une clé "graphique_html" (courbe tracée par graphiques.py) affichée sous l'énoncé.
+    """
+    corps = _corps_exercice_memoise if memoiser and not hors_ligne else _corps_exercice
+    fragments = []
+    pour_mathjax = 0
+    for i, exo in enumerate(exercices, 1):
+        fragment, n = corps(
+            exo['question'], exo['reponse'], exo['correction_detaillee'], exo['difficulte'], hors_ligne,
+            exo.get('verification')
+        )
+        if exo.get('graphique_html'):
+            fragment = fragment.replace(_EMPLACEMENT_GRAPHIQUE, exo['graphique_html'], 1)
+        fragments.append(_DEBUT_EXERCICE + str(i) + fragment)
+        pour_mathjax += n
+    valeurs = {
+        "TITRE": html.escape(titre),
+        "MATHJAX": SCRIPTS_MATHJAX if (pour_mathjax or not hors_ligne) else "",
+        "EXERCICES": "".join(fragments),
+    }
+    return "".join(
+        morceau if i % 2 == 0 else valeurs[morceau] for i, morceau in enumerate(_MORCEAUX_PAGE)
+    )
+
+
+def generer_html_corrige(titre, variantes, hors_ligne=False):
+    """
+    Corrigé regroupé d'un lot (mode classe) : les réponses de chaque version, à la suite.
+    `variantes` est un itérable de (nom, exercices) parcouru une seule fois ; la page est
+    produite morceau par morceau (générateur de str) pour être écrite au fil de l'eau,
+    sans garder tout le lot en mémoire.
+    """
+    valeurs = {"TITRE": html.escape(titre), "MATHJAX": "" if hors_ligne else SCRIPTS_MATHJAX}
+    for i, morceau in enumerate(_MORCEAUX_PAGE):
+        if i % 2 == 0:
+            yield morceau
+        elif morceau != "EXERCICES":
+            yield valeurs[morceau]
+        else:
+            for nom, exercices in variantes:
+                reponses = "".join(
+                    f"\n                <li>{formater_texte(exo['reponse'], sauts_de_ligne=False, hors_ligne=hors_ligne)}</li>"
+                    for exo in exercices
+                )
+                yield f"""
+        <div class="exercice">
+            <div class="exercice-header">
+                <h2>{html.escape(nom)}</h2>
+            </div>
+            <ol class="reponse">{reponses}
+            </ol>
+        </div>
+        """
@@ -0,0 +1,486 @@
+import multiprocessing
+import re
+import signal
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+# VÉRIFICATION DES RÉPONSES AVEC SYMPY (en arrière-plan)
+# ------------------------------------------------------------------
+# On extrait des exercices des affirmations vérifiables :
+#   - dérivée       : "f(x) = ..." dans l'énoncé et "f'(x) = ..." dans la réponse / le détail
+#   - expression    : "f(x) = ..." réécrite autrement, ou "f(2) = ..." (valeur)
+#   - limite        : "\lim_{x \to a} ... = L"
+#   - solutions     : une équation dans l'énoncé et "S = \{...\}" dans la réponse
+#   - calcul        : égalité purement numérique
+# Les calculs SymPy tournent dans des processus séparés (une simplification peut durer
+# ou boucler) avec un délai par expression ; les résultats sont mémorisés par expression
+# (LRU borné ; un délai côté pool ou un processus tué n'est pas mémorisé : on réessaiera).
+#
+# Statut d'un exercice : "verifie" (tout est juste), "non_verifie" (au moins une
+# affirmation fausse), "delai" (au moins un calcul trop long), None (rien de vérifiable).
+
+DELAI_PAR_EXPRESSION = 5  # secondes
+TAILLE_MEMO = 20000  # affirmations mémorisées
+
+# 1. EXTRACTION (côté application : regex uniquement, pas de SymPy)
+# ------------------------------------------------------------------
+_RE_MATHS = re.compile(r"(?<!\\)\$\$(.+?)(?<!\\)\$\$|(?<!\\)\$(.+?)(?<!\\)\$", re.DOTALL)
+# Formules qu'on ne sait pas découper en égalités fiables
+_RE_IGNORER = re.compile(
+    r"\\begin|\\\\|&|<|>|\\[lg]eq?\b|\\neq?\b|\\approx|\\iff|\\Leftrightarrow|\\Rightarrow|\\implies|\\in\b|\\forall|\\quad|\\text"
+)
+_RE_DEFINITION = re.compile(r"^\s*([a-zA-Z])\s*\(\s*x\s*\)\s*$")
+_RE_DERIVEE = re.compile(r"^\s*([a-zA-Z])\s*(?:'|\\prime|\^\{\\prime\})\s*\(\s*x\s*\)\s*$")
+_RE_VALEUR = re.compile(r"^\s*([a-zA-Z])\s*\(\s*(-?\d+(?:\{,\}\d+)?)\s*\)\s*$")
+_RE_LIMITE = re.compile(
+    r"^\s*\\lim(?:\\limits)?\s*_\{\s*x\s*\\(?:to|rightarrow)\s*([^}]*)\}\s*(.+)$", re.DOTALL
+)
+_RE_ENSEMBLE = re.compile(r"^\s*(?:\\left)?\\\{(.*?)(?:\\right)?\\\}\s*$", re.DOTALL)
+
+
+def _formules(texte):
+    return [(m.group(1) or m.group(2)).strip() for m in _RE_MATHS.finditer(texte)]
+
+
+def _membres(formule):
+    """Découpe "a = b = c" en membres, ou [] si la formule n'est pas une simple chaîne d'égalités."""
+    if _RE_IGNORER.search(formule):
+        return []
+    membres = [m.strip() for m in formule.split("=")]
+    if len(membres) < 2 or any(not m for m in membres):
+        return []
+    return membres
+
+
+def _normaliser(tex):
+    return re.sub(r"\s+", " ", tex).strip()
+
+
+def extraire_assertions(exo):
+    """
+    Liste d'affirmations vérifiables de l'exercice, sous forme de tuples hashables :
+    ("derivee", f, f') / ("egalite", a, b) / ("valeur", f, point, v) /
+    ("limite", expr, point, L) / ("solution", gauche, droite, valeur).
+    Les expressions restent en LaTeX ; la conversion se fait dans le processus de calcul.
+    """
+    definitions = {}
+    equations = []
+    for formule in _formules(exo["question"]):
+        membres = _membres(formule)
+        if len(membres) != 2:
+            continue
+        m = _RE_DEFINITION.match(membres[0])
+        if m:
+            definitions[m.group(1)] = membres[1]
+        elif "x" in formule:
+            equations.append((membres[0], membres[1]))
+
+    assertions = []
+    for champ in ("reponse", "correction_detaillee"):
+        for formule in _formules(exo[champ]):
+            membres = _membres(formule)
+            for gauche, droite in zip(membres, membres[1:]):
+                d = _RE_DERIVEE.match(gauche)
+                f = _RE_DEFINITION.match(gauche)
+                v = _RE_VALEUR.match(gauche)
+                lim = _RE_LIMITE.match(gauche)
+                if d and d.group(1) in definitions:
+                    assertions.append(("derivee", definitions[d.group(1)], droite))
+                elif f and f.group(1) in definitions and "x" in droite:
+                    assertions.append(("egalite", definitions[f.group(1)], droite))
+                elif v and v.group(1) in definitions:
+                    assertions.append(("valeur", definitions[v.group(1)], v.group(2), droite))
+                elif lim:
+                    expr = lim.group(2)
+                    f_lim = _RE_DEFINITION.match(expr)
+                    if f_lim:
+                        if f_lim.group(1) not in definitions:
+                            continue
+                        expr = definitions[f_lim.group(1)]
+                    assertions.append(("limite", expr, lim.group(1), droite))
+                elif not re.search(r"[a-zA-Z]", re.sub(r"\\[a-zA-Z]+", "", gauche + droite)):
+                    assertions.append(("egalite", gauche, droite))
+
+    # Solutions : une seule équation dans l'énoncé, "S = \{a ; b\}" dans la réponse
+    if len(equations) == 1:
+        for formule in _formules(exo["reponse"]):
+            membres = _membres(formule)
+            if len(membres) == 2 and membres[0] == "S":
+                ensemble = _RE_ENSEMBLE.match(membres[1])
+                if ensemble:
+                    for valeur in re.split(r"\s*;\s*", ensemble.group(1).strip()):
+                        if valeur:
+                            assertions.append(("solution", equations[0][0], equations[0][1], valeur))
+
+    # Normalisation (espaces) : même affirmation -> même clé de mémoïsation
+    return list(dict.fromkeys(tuple(_normaliser(p) for p in a) for a in assertions))
+
+
+# 2. CALCUL (dans les processus du pool)
+# ------------------------------------------------------------------
+class _DelaiDepasse(Exception):
+    pass
+
+
+def _alarme(signum, frame):
+    raise _DelaiDepasse()
+
+
+def _accolade(tex, i):
+    """Indice de l'accolade fermante correspondant à l'ouvrante tex[i]."""
+    profondeur = 0
+    for j in range(i, len(tex)):
+        if tex[j] == "{":
+            profondeur += 1
+        elif tex[j] == "}":
+            profondeur -= 1
+            if profondeur == 0:
+                return j
+    raise ValueError("accolades déséquilibrées")
+
+
+def _argument(tex, i):
+    """Argument LaTeX commençant en tex[i] : {groupe} ou un seul caractère. Renvoie (contenu, fin)."""
+    while i < len(tex) and tex[i] == " ":
+        i += 1
+    if i < len(tex) and tex[i] == "{":
+        fin = _accolade(tex, i)
+        return tex[i + 1:fin], fin + 1
+    return tex[i:i + 1], i + 1
+
+
+def _dans_commande(tex, i):
+    """tex[i] fait-il partie d'un nom de commande LaTeX (ex: le "e" de "\\cdote") ?"""
+    while i > 0 and tex[i - 1].isalpha():
+        i -= 1
+    return i > 0 and tex[i - 1] == "\\"
+
+
+def latex_vers_sympy(tex):
+    """Traduit le LaTeX courant des fiches (\\frac, \\sqrt, e^{...}, \\ln...) en syntaxe SymPy."""
+    tex = tex.replace("{,}", ".").replace("\\left", "").replace("\\right", "")
+    tex = tex.replace("\\mathrm{e}", "e").replace("\\,", " ").replace("\\!", "")
+    tex = re.sub(r"\\[dt]frac", r"\\frac", tex)
+    sortie = []
+    i = 0
+    while i < len(tex):
+        if tex.startswith("\\frac", i):
+            num, i = _argument(tex, i + 5)
+            den, i = _argument(tex, i)
+            sortie.append(f" (({latex_vers_sympy(num)})/({latex_vers_sympy(den)}))")
+        elif tex.startswith("\\sqrt", i):
+            arg, i = _argument(tex, i + 5)
+            sortie.append(f" sqrt({latex_vers_sympy(arg)})")
+        elif tex.startswith("e^", i) and not _dans_commande(tex, i):
+            arg, i = _argument(tex, i + 2)
+            sortie.append(f" exp({latex_vers_sympy(arg)})")
+        elif tex[i] == "^":
+            arg, i = _argument(tex, i + 1)
+            sortie.append(f"**({latex_vers_sympy(arg)})")
+        else:
+            sortie.append(tex[i])
+            i += 1
+    texte = "".join(sortie)
+    # Espaces autour des fonctions : "2x exp(-x)" et pas "2xexp(-x)" (lu comme x*e*x*p)
+    for latex, sympy_ in (("\\cdot", "*"), ("\\times", "*"), ("\\ln", " log "), ("\\log", " log "),
+                          ("\\exp", " exp "), ("\\arcsin", " asin "), ("\\arccos", " acos "),
+                          ("\\arctan", " atan "), ("\\sin", " sin "), ("\\cos", " cos "), ("\\tan", " tan "),
+                          ("\\infty", "oo"), ("\\pi", " pi "), ("{", "("), ("}", ")")):
+        texte = texte.replace(latex, sympy_)
+    if "\\" in texte:
+        raise ValueError(f"commande LaTeX non gérée : {texte}")
+    return texte
+
+
+# parse_expr finit par un eval : le texte vient du modèle, donc seule une liste blanche de
+# jetons passe (nombres, opérateurs, parenthèses, fonctions connues, lettres isolées).
+# Pas de ".", de chaînes, de crochets ni de "_" : ni attribut, ni __import__, ni appel inconnu.
+FONCTIONS_SYMPY = ("exp", "log", "sqrt", "sin", "cos", "tan", "asin", "acos", "atan", "pi", "oo")
+_RE_JETON = re.compile(r"\s+|\d+(?:\.\d+)?|[a-zA-Z]+|\*\*|[-+*/^(),]")
+
+
+def _filtrer(texte):
+    """Texte sûr pour parse_expr, ou ValueError. Un mot inconnu ("ax") devient ses lettres ("a x")."""
+    jetons = []
+    position = 0
+    for m in _RE_JETON.finditer(texte):
+        if m.start() != position:
+            break
+        position = m.end()
+        jeton = m.group()
+        if jeton.isalpha() and len(jeton) > 1 and jeton not in FONCTIONS_SYMPY:
+            jeton = " ".join(jeton)
+        jetons.append(jeton)
+    if position != len(texte):
+        raise ValueError(f"caractère non autorisé : {texte[position:position + 20]!r}")
+    return "".join(jetons)
+
+
+def _espace_sympy():
+    """Espace de noms de l'eval de parse_expr : rien d'autre que SymPy, et pas de builtins."""
+    import sympy
+    noms = {nom: getattr(sympy, nom) for nom in FONCTIONS_SYMPY}
+    noms.update({nom: getattr(sympy, nom) for nom in ("Symbol", "Integer", "Float", "Rational", "Function")})
+    noms["__builtins__"] = {}
+    return noms
+
+
+def _expr(tex):
+    from sympy import E, Symbol
+    from sympy.parsing.sympy_parser import (
+        implicit_multiplication_application, parse_expr, standard_transformations,
+    )
+    transformations = standard_transformations + (implicit_multiplication_application,)
+    return parse_expr(
+        _filtrer(latex_vers_sympy(tex)), transformations=transformations,
+        local_dict={"x": Symbol("x", real=True), "e": E}, global_dict=_espace_sympy()
+    )
+
+
+def _egal(a, b):
+    import cmath
+    import random
+    from sympy import N, simplify
+    difference = a - b
+    if simplify(difference) == 0:
+        return True
+    # simplify ne prouve pas toujours l'égalité : test numérique en quelques points
+    symboles = sorted(difference.free_symbols, key=str)
+    rng = random.Random(0)
+    points_valides = 0
+    for _ in range(5):
+        valeurs = {s: rng.uniform(0.3, 2.7) for s in symboles}
+        ecart = complex(N(difference.subs(valeurs)))
+        if cmath.isnan(ecart):  # hors du domaine de définition
+            continue
+        points_valides += 1
+        if abs(ecart) > 1e-8 * max(1.0, abs(complex(N(a.subs(valeurs))))):
+            return False
+    if not points_valides:
+        raise ValueError("aucun point de test dans le domaine")
+    return True
+
+
+_RE_DECIMAL = re.compile(r"^-?\d+(?:\{,\}|[.,])(\d+)$")
+
+
+def _egal_ou_arrondi(valeur, tex):
+    """
+    valeur (SymPy) == tex (LaTeX). Un décimal écrit ("\\sqrt{2} = 1{,}414") est une valeur
+    approchée : juste s'il est l'arrondi ou la troncature de la valeur à sa dernière décimale.
+    """
+    decimal = _RE_DECIMAL.match(tex)
+    if decimal is None or valeur.free_symbols:
+        return _egal(valeur, _expr(tex))
+    from sympy import N
+    exacte = complex(N(valeur))
+    if abs(exacte.imag) > 1e-12:
+        return False
+    ecrite = float(_expr(tex))
+    unite = 10 ** -len(decimal.group(1))
+    marge = 1e-9 * max(1.0, abs(ecrite))
+    arrondi = abs(exacte.real - ecrite) <= unite / 2 + marge
+    tronque = -marge <= abs(exacte.real) - abs(ecrite) < unite + marge and exacte.real * ecrite >= 0
+    return arrondi or tronque
+
+
+def _point_limite(tex):
+    tex = tex.strip()
+    direction = "+-"
+    m = re.match(r"^(.*)\^\{?([+-])\}?$", tex)
+    if m and m.group(1) not in ("", "+", "-"):
+        tex, direction = m.group(1), m.group(2)
+    return _expr(tex), direction
+
+
+def _calculer(assertion):
+    from sympy import Symbol, diff, limit, nan, oo, zoo
+    x = Symbol("x", real=True)
+    genre = assertion[0]
+    if genre == "derivee":
+        return _egal(diff(_expr(assertion[1]), x), _expr(assertion[2]))
+    if genre == "egalite":
+        gauche, droite = assertion[1], assertion[2]
+        if _RE_DECIMAL.match(gauche) and not _RE_DECIMAL.match(droite):
+            gauche, droite = droite, gauche  # "1{,}414 = \\sqrt{2}"
+        return _egal_ou_arrondi(_expr(gauche), droite)
+    if genre == "valeur":
+        return _egal_ou_arrondi(_expr(assertion[1]).subs(x, _expr(assertion[2])), assertion[3])
+    if genre == "limite":
+        point, direction = _point_limite(assertion[2])
+        attendu = _expr(assertion[3])
+        obtenu = limit(_expr(assertion[1]), x, point, direction)
+        if attendu in (oo, -oo) or obtenu in (oo, -oo, zoo, nan):
+            return obtenu == attendu
+        return _egal(obtenu, attendu)
+    if genre == "solution":
+        valeur = _expr(assertion[3])
+        return _egal(_expr(assertion[1]).subs(x, valeur), _expr(assertion[2]).subs(x, valeur))
+    raise ValueError(genre)
+
+
+def verifier_assertion(assertion, delai=DELAI_PAR_EXPRESSION):
+    """
+    Exécuté dans un processus du pool. Renvoie "vrai", "faux", "delai" ou "inconnu"
+    (affirmation que SymPy ne sait pas lire : elle ne compte pas dans le statut).
+    """
+    avec_alarme = hasattr(signal, "SIGALRM")
+    if avec_alarme:
+        signal.signal(signal.SIGALRM, _alarme)
+        signal.setitimer(signal.ITIMER_REAL, delai)
+    try:
+        return "vrai" if _calculer(assertion) else "faux"
+    except _DelaiDepasse:
+        return "delai"
+    except Exception:
+        return "inconnu"
+    finally:
+        if avec_alarme:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _prechauffer():
+    import sympy  # noqa: F401  (import de SymPy ~1 s : une fois par processus, pas au 1er calcul)
+
+
+# 3. ORCHESTRATION
+# ------------------------------------------------------------------
+def statut_exercice(resultats):
+    if "faux" in resultats:
+        return "non_verifie"
+    if "delai" in resultats:
+        return "delai"
+    if "vrai" in resultats:
+        return "verifie"
+    return None
+
+
+class Verificateur:
+    """
+    Pool de processus partagé (un par application) + mémoïsation des résultats par affirmation.
+    verifier(exercices) renvoie un statut par exercice (voir statut_exercice).
+    Partagé entre les threads des sessions Streamlit : mémo et pool sont protégés par un verrou.
+    """
+
+    def __init__(self, max_workers=2, delai=DELAI_PAR_EXPRESSION, taille_memo=TAILLE_MEMO):
+        self.max_workers = max_workers
+        self.delai = delai
+        self.taille_memo = taille_memo
+        self._memo = OrderedDict()  # affirmation -> résultat (du moins au plus récemment utilisé)
+        self._pool = None
+        self._verrou = threading.Lock()
+
+    def _executor(self):
+        with self._verrou:
+            if self._pool is None:
+                # "spawn" : pas de fork d'un processus Streamlit multi-thread
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_prechauffer
+                )
+            return self._pool
+
+    def _recycler(self, pool):
+        """
+        Arrête `pool` et tue ses processus (un calcul bloqué dans du C ignore SIGALRM) ;
+        l'appel suivant repart d'un pool neuf. Sans effet si un autre thread l'a déjà fait.
+        """
+        with self._verrou:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        processus = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for p in processus:
+            p.terminate()
+
+    def _memoriser(self, assertion, resultat):
+        with self._verrou:
+            self._memo[assertion] = resultat
+            self._memo.move_to_end(assertion)
+            if len(self._memo) > self.taille_memo:
+                self._memo.popitem(last=False)
+
+    def verifier(self, exercices):
+        assertions = [extraire_assertions(exo) for exo in exercices]
+        resultats = {}
+        with self._verrou:
+            for liste in assertions:
+                for a in liste:
+                    resultat = self._memo.get(a)
+                    if resultat is not None:
+                        self._memo.move_to_end(a)
+                        resultats[a] = resultat
+        a_calculer = {a for liste in assertions for a in liste if a not in resultats}
+        pool = None
+        try:
+            pool = self._executor()
+            futures = {a: pool.submit(verifier_assertion, a, self.delai) for a in a_calculer}
+            for a, future in futures.items():
+                try:
+                    # Marge au-delà du délai interne (import SymPy au démarrage du processus...)
+                    resultats[a] = future.result(timeout=self.delai + 10)
+                    self._memoriser(a, resultats[a])
+                except FuturesTimeout:
+                    # Processus bloqué (ou pool saturé) : pas mémorisé, et le pool est remplacé
+                    # pour ne pas rester bloqué pour toutes les sessions
+                    resultats[a] = "delai"
+                    self._recycler(pool)
+                except (BrokenProcessPool, CancelledError):
+                    resultats[a] = "delai"  # pool recyclé par ce thread ou un autre
+        except (BrokenProcessPool, RuntimeError):
+            # Un processus a été tué (mémoire...), ou le pool vient d'être arrêté par une autre
+            # session : on repartira d'un pool neuf la prochaine fois
+            if pool is not None:
+                self._recycler(pool)
+            for a in a_calculer:
+                resultats.setdefault(a, "delai")
+        return [statut_exercice([resultats[a] for a in liste]) for liste in assertions]
+
+    def fermer(self):
+        with self._verrou:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# 4. CAS DE CONTRÔLE (python verification.py)
+# ------------------------------------------------------------------
+# (énoncé, réponse, statut attendu) : à relancer après toute modification de l'extraction
+# ou de la traduction LaTeX -> SymPy.
+CAS_DE_CONTROLE = [
+    ("$f(x) = x^2$", "$f'(x) = 2x$", "verifie"),
+    ("$f(x) = x^2$", "$f'(x) = 3x$", "non_verifie"),
+    ("$f(x) = \\sin(x)$", "$f'(x) = \\cos(x)$", "verifie"),
+    ("$f(x) = \\sin(x)$", "$f'(x) = -\\cos(x)$", "non_verifie"),
+    ("$f(x) = \\sin(x)\\cos(x)$", "$f'(x) = \\cos^2(x) - \\sin^2(x)$", "verifie"),
+    ("$f(x) = \\arctan(x)$", "$f'(x) = \\frac{1}{1+x^2}$", "verifie"),
+    ("$f(x) = e^{-x}$", "$f(1) = 0{,}368$", "verifie"),
+    ("Calculer $\\sqrt{2}$", "$\\sqrt{2} = 1{,}414$", "verifie"),
+    ("Calculer $\\sqrt{2}$", "$\\sqrt{2} = 1{,}5$", "non_verifie"),
+    ("$f(x) = __import__('os').getpid()$", "$f'(x) = 1$", None),  # refusé avant SymPy
+]
+
+
+def main():
+    verificateur = Verificateur()
+    try:
+        statuts = verificateur.verifier([
+            {"question": q, "reponse": r, "correction_detaillee": ""} for q, r, _ in CAS_DE_CONTROLE
+        ])
+    finally:
+        verificateur.fermer()
+    erreurs = 0
+    for (question, reponse, attendu), statut in zip(CAS_DE_CONTROLE, statuts):
+        ok = statut == attendu
+        erreurs += not ok
+        print(f"{'ok ' if ok else 'ERR'} {question} | {reponse} -> {statut} (attendu {attendu})")
+    return 1 if erreurs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())